@@ -0,0 +1,166 @@
+import time
+
+import numpy as np
+
+from similarity import normalize_rows, top_k
+
+
+class LSHIndex:
+    '''
+    Approximate nearest-neighbour index for cosine similarity between user
+    interest vectors, based on random-projection (SimHash) locality
+    sensitive hashing.
+
+    Every table hashes a vector to num_bits sign bits of its projection on
+    random hyperplanes. Interest scores are all positive, so the vectors are
+    centred on their mean before hashing to spread them over the buckets.
+    A query collects the users sharing a bucket with it in any table
+    (optionally also the buckets one bit away), and only those candidates
+    are scored exactly and ranked.
+
+    Attributes:
+    ----------
+    user_ids : list
+        The Steam id of every indexed user.
+    vectors : np.ndarray
+        The normalized interest vectors.
+    eligible : np.ndarray
+        Boolean mask of the users that may be returned.
+    '''
+    def __init__(self, num_tables=8, num_bits=12, seed=0):
+        self.num_tables = num_tables
+        self.num_bits = num_bits
+        self.seed = seed
+
+    def build(self, user_ids, interests, eligible=None):
+        '''
+        Index the given users.
+
+        Parameters:
+        -----------
+        user_ids : list
+            The Steam id of every row of interests.
+        interests : np.ndarray
+            The users x genres interest matrix.
+        eligible : np.ndarray
+            Boolean mask of the users that may be returned, all by default.
+        '''
+        self.user_ids = [str(user_id) for user_id in user_ids]
+        self.index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self.vectors = normalize_rows(interests)
+        self.eligible = np.ones(len(self.user_ids), dtype=bool) if eligible is None else np.asarray(eligible, dtype=bool)
+        self.center = self.vectors.mean(axis=0) if len(self.vectors) else np.zeros(self.vectors.shape[1])
+
+        rng = np.random.default_rng(self.seed)
+        self.planes = rng.standard_normal((self.num_tables, self.num_bits, self.vectors.shape[1]))
+        codes = self._codes(self.vectors)
+        self.order = np.argsort(codes, axis=1, kind='stable')
+        self.sorted_codes = np.take_along_axis(codes, self.order, axis=1)
+        return self
+
+    @classmethod
+    def from_engine(cls, engine, **kwargs):
+        '''
+        Index the users of a SimilarityEngine.
+        '''
+        return cls(**kwargs).build(engine.user_ids, engine.vectors, engine.eligible)
+
+    def _codes(self, vectors):
+        bits = np.einsum('tbd,nd->tnb', self.planes, vectors - self.center) > 0
+        return bits.astype(np.int64) @ (1 << np.arange(self.num_bits, dtype=np.int64))
+
+    def candidates(self, vector, multiprobe=True):
+        '''
+        Return the indices of the users sharing a bucket with vector.
+        '''
+        codes = self._codes(vector[None, :])[:, 0]
+        found = []
+        for table, code in enumerate(codes):
+            probes = [code]
+            if multiprobe:
+                probes += [code ^ (1 << bit) for bit in range(self.num_bits)]
+            for probe in probes:
+                lo, hi = np.searchsorted(self.sorted_codes[table], [probe, probe + 1])
+                found.append(self.order[table, lo:hi])
+        return np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+    def query(self, user_id, k=5, multiprobe=True):
+        '''
+        Return about the k users most similar to user_id as (user ID, similarity) tuples.
+        '''
+        user = self.index[str(user_id)]
+        vector = self.vectors[user]
+        candidates = self.candidates(vector, multiprobe)
+        candidates = candidates[self.eligible[candidates] & (candidates != user)]
+        scores = self.vectors[candidates] @ vector
+        return [(self.user_ids[candidates[i]], float(scores[i])) for i in top_k(scores, k)]
+
+    def save(self, path):
+        '''
+        Write the index to path, as is (np.savez would append .npz to a path without it).
+        '''
+        with open(path, 'wb') as file:
+            np.savez(file, user_ids=np.array(self.user_ids), vectors=self.vectors, eligible=self.eligible,
+                     center=self.center, planes=self.planes, order=self.order, sorted_codes=self.sorted_codes,
+                     params=np.array([self.num_tables, self.num_bits, self.seed]))
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Read an index written by save.
+        '''
+        with open(path, 'rb') as file, np.load(file) as data:
+            num_tables, num_bits, seed = data['params'].tolist()
+            index = cls(num_tables, num_bits, seed)
+            index.user_ids = data['user_ids'].tolist()
+            index.index = {user_id: i for i, user_id in enumerate(index.user_ids)}
+            for name in ('vectors', 'eligible', 'center', 'planes', 'order', 'sorted_codes'):
+                setattr(index, name, data[name])
+        return index
+
+
+
+def recall_report(index, engine, user_ids, k=5, multiprobe=True):
+    '''
+    Compare the index with the exact similarity used by recommend_users.
+
+    Parameters:
+    -----------
+    index : LSHIndex
+        The approximate index.
+    engine : SimilarityEngine
+        The exact engine over the same users.
+    user_ids : list
+        The users to query.
+    k : int
+        The number of similar users per query.
+
+    Returns:
+    --------
+    dict
+        The mean recall@k of the index and the mean latency in milliseconds
+        of both methods.
+    '''
+    recalls = []
+    exact_time = 0.0
+    approx_time = 0.0
+    for user_id in user_ids:
+        start = time.perf_counter()
+        exact = {user for user, _ in engine.recommend(user_id, k)}
+        exact_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        approx = {user for user, _ in index.query(user_id, k, multiprobe)}
+        approx_time += time.perf_counter() - start
+
+        if exact:
+            recalls.append(len(exact & approx) / len(exact))
+
+    num_queries = max(len(user_ids), 1)
+    return {
+        'queries': len(user_ids),
+        'k': k,
+        'recall': float(np.mean(recalls)) if recalls else 1.0,
+        'exact_ms': 1000 * exact_time / num_queries,
+        'ann_ms': 1000 * approx_time / num_queries,
+    }
@@ -1,99 +1,470 @@
 import json
+import math
 import os
+import random
 import requests
-from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import re
+import shutil
+import time
+from frontier import PriorityFrontier, SpillQueue, VisitedSet
+from metrics import metrics
+from store import APICache, CacheSection
+from stream import CrawlStream
+from transport import HTTPTransport
+
+STEAM_API_URL = "http://api.steampowered.com"
+STEAM_STORE_URL = "http://store.steampowered.com"
+TWITCH_API_URL = "https://api.twitch.tv/helix"
+TWITCH_AUTH_URL = "https://id.twitch.tv/oauth2/token"
+
+# Fields of the Steam appdetails payload kept at ingest. The graph only
+# reads name and genres; descriptions, media and requirements are dropped.
+DETAIL_FIELDS = ("name", "genres", "type", "steam_appid")
+
+# Priority a crawled user passes on to each of its friends in
+# SteamAPI.get_data_budgeted, from its filtered owned games.
+CRAWL_PRIORITIES = {
+    'bfs': lambda games: 0,
+    'shared_friends': lambda games: 1,
+    'playtime': lambda games: math.log1p(sum(game["playtime_forever"] for game in games) / 60),
+}
 
 
 class SteamAPI:
-    def __init__(self, key_file_name, cache):
+    def __init__(self, key_file_name, cache, detail_store=None, checkpoint=None, transport=None,
+                 api_url=STEAM_API_URL, store_url=STEAM_STORE_URL):
         with open(key_file_name) as f:
             conf = json.load(f)
         self.api_key = conf["api_key"]
         self.root_user_id = conf["steam_id"]
         self.cache = cache
+        self.api_url = api_url
+        self.store_url = store_url
+        self.transport = transport if transport is not None else HTTPTransport()
+        self.detail_store = detail_store if detail_store is not None else AppDetailStore()
+        self.checkpoint = checkpoint if checkpoint is not None else CrawlCheckpoint()
     
 
-    def get_data(self, max_depth):  
+    @metrics.timed('crawl')
+    def get_data(self, max_depth, max_in_flight=1, checkpoint_every=500,
+                 frontier_memory=100000, bloom_capacity=None, exact_visited=True, stream_file=None):
+        '''
+        Crawl the friend network of the root user breadth-first and store the
+        friend graph, owned games and game details in the cache.
+
+        Each BFS level is fetched in chunks of checkpoint_every users. With
+        max_in_flight > 1 the requests of a chunk are issued concurrently from
+        a thread pool, while the results are merged in queue order, so the
+        output is identical to the serial crawl. After every chunk its
+        results are committed to the results store of the crawl checkpoint
+        and the frontier and visited users to the checkpoint itself, and an
+        interrupted crawl of the same root and depth resumes from there. Game details are fetched in a separate stage
+        once the friend network is known, see fetch_game_details.
+
+        Visited users are tracked in a hashed VisitedSet and the BFS levels
+        are SpillQueues that keep at most about frontier_memory users in
+        memory. Both append to files in the spill directory, and a checkpoint
+        only records how far those files go, so the cost of the crawl,
+        checkpoints included, grows linearly with the number of users found.
+
+        Parameters:
+        -----------
+        max_depth : int
+            The depth of the friend network to crawl.
+        max_in_flight : int
+            The maximum number of concurrent requests, 1 for a serial crawl.
+        checkpoint_every : int
+            The number of users crawled between two checkpoints.
+        frontier_memory : int
+            The number of queued users per BFS level kept in memory.
+        bloom_capacity : int
+            The expected number of visited users. If given, membership checks
+            go through a Bloom filter of this capacity first.
+        exact_visited : bool
+            Whether to keep the exact visited set next to the Bloom filter.
+            Without it memory stays fixed but about 0.1% of new users are
+            wrongly skipped.
+        stream_file : str
+            If given, every crawled user and game is also written to this
+            NDJSON file as soon as it is known (see CrawlStream). A resumed
+            crawl appends to the file and may repeat the users of the chunk
+            that was interrupted.
+        '''
         if self.cache.get('user_friend_graph'):
             print("Cache already created.")
             return 
 
-        friend_tree = {}
-        user_game_map = {}
-        game_detail = {}
-
-        visited = []
-        q = deque()
-
-        q.append((self.root_user_id, 0))
-        visited.append(self.root_user_id)
-
-        while len(q) != 0:
-            tp = q.popleft()
-            id = tp[0]
-            depth = tp[1]
-            game_list = self.get_game_list(id)
-            game_list_shorten = []
-            user_game_map[id] = []
-            for game_time in game_list:
-                if game_time["playtime_forever"] > 600:
-                    user_game_map[id].append(game_time)
-                    game_list_shorten.append(game_time)
-
-            for g in game_list_shorten:
-                game_id = g["appid"]
-                if game_id not in game_detail:
-                    detail = self.get_game_detail(game_id)
-                    game_detail[game_id] = detail
-
-            friend_list = self.get_friend_list(id)
-            if depth == max_depth:
-                friend_tree[id] = []
+        spill_dir = self.checkpoint.spill_dir
+        state = self.checkpoint.load(self.root_user_id, max_depth)
+        if state is None:
+            self.checkpoint.clear()
+            depth = 0
+            level = SpillQueue(spill_dir, frontier_memory, 'level-0')
+            level.append(self.root_user_id)
+            next_level = SpillQueue(spill_dir, frontier_memory, 'level-1')
+            visited = VisitedSet(bloom_capacity, exact=exact_visited, log_file=os.path.join(spill_dir, 'visited.txt'))
+            visited.add(self.root_user_id)
+        else:
+            depth = state["depth"]
+            level = SpillQueue.from_state(state["level"], spill_dir, frontier_memory, f'level-{depth}')
+            next_level = SpillQueue.from_state(state["next_level"], spill_dir, frontier_memory, f'level-{depth + 1}')
+            visited = VisitedSet.from_state(state["visited"])
+        results = self.checkpoint.results()
+        friend_tree = CacheSection(results, 'user_friend_graph')
+        user_game_map = CacheSection(results, 'user_game_mapping')
+        fetched_at = CacheSection(results, 'user_fetched_at')
+        if state is not None:
+            print(f"Resuming crawl at depth {depth}, {len(friend_tree)} users done.")
+        stream = CrawlStream(stream_file, append=state is not None) if stream_file else None
+
+        while len(level) != 0:
+            chunk = level.take(checkpoint_every)
+            game_lists = self._fetch_all(self.get_game_list, chunk, max_in_flight)
+            friend_lists = self._fetch_all(self.get_friend_list, chunk, max_in_flight)
+            metrics.increment('crawl_users_total', len(chunk))
+            now = time.time()
+
+            for id, game_list in zip(chunk, game_lists):
+                user_game_map[id] = self.filter_game_list(game_list)
+                fetched_at[id] = now
+
+            for id, friend_list in zip(chunk, friend_lists):
+                if depth == max_depth:
+                    friend_tree[id] = [friend for friend in friend_list if friend in friend_tree]
+                    continue
+
+                friend_tree[id] = friend_list
                 for friend in friend_list:
-                    if friend in friend_tree:
-                        friend_tree[id].append(friend)
-                continue
-            
-            friend_tree[id] = friend_list
-            for friend in friend_list:
-                if friend in visited:
-                    continue 
-                visited.append(friend)
-                q.append((friend, depth+1))
+                    if friend in visited:
+                        continue 
+                    visited.add(friend)
+                    next_level.append(friend)
+
+            if stream:
+                for id in chunk:
+                    stream.write_user(id, friend_tree[id], user_game_map[id])
+                stream.flush()
+
+            if len(level) == 0:
+                depth += 1
+                level = next_level
+                next_level = SpillQueue(spill_dir, frontier_memory, f'level-{depth + 1}')
+            self.checkpoint.save({
+                "root": self.root_user_id,
+                "max_depth": max_depth,
+                "depth": depth,
+                "level": level.to_state(),
+                "next_level": next_level.to_state(),
+                "visited": visited.to_state()
+            })
+
+        game_ids = [g["appid"] for games in user_game_map.values() for g in games]
+        game_detail = self.fetch_game_details(game_ids, max_in_flight)
+        if stream:
+            for game_id, detail in game_detail.items():
+                stream.write_app(game_id, detail)
+            stream.end()
 
         self.cache.set('user_friend_graph', friend_tree)
         self.cache.set('user_game_mapping', user_game_map)
         self.cache.set('game_detail', game_detail)
+        self.cache.set('user_fetched_at', fetched_at)
         self.cache.save_cache()
+        self.checkpoint.clear()
+
+
+    @metrics.timed('crawl')
+    def get_data_budgeted(self, max_users=None, max_requests=None, priority='shared_friends', friend_cap=None,
+                          max_depth=None, max_in_flight=1, checkpoint_every=500, seed=0, stream_file=None):
+        '''
+        Crawl the friend network of the root user within a fixed budget,
+        most promising users first, and store the result in the cache like
+        get_data.
+
+        Instead of expanding every friend level by level, discovered users
+        wait in a PriorityFrontier. Every crawled user raises the priority of
+        each of its friends by the weight of the priority strategy (see
+        CRAWL_PRIORITIES):
+
+        'shared_friends' : 1, so a user's priority is the number of crawled
+            users it is friends with (for a friend of the root, one plus its
+            number of friends shared with the root).
+        'playtime' : the log of the crawled user's total playtime in hours,
+            so the circles of active players are crawled first.
+        'bfs' : 0, a plain breadth-first crawl.
+
+        The crawl stops when max_users users are crawled, when the next users
+        would take more than max_requests owned-games and friend-list
+        requests (two per user; retries of the transport are not counted),
+        or when the frontier is empty. With friend_cap, a crawled user adds at
+        most friend_cap randomly sampled new users to the frontier, so a
+        single account with thousands of friends cannot flood it; friends
+        already queued still get their priority raised. Friend lists are
+        restricted to crawled users at the end, and the game details of the
+        crawled users are then fetched through the detail store, outside the
+        request budget.
+
+        Users are crawled in batches of max_in_flight. Every checkpoint_every
+        users the results are committed to the results store of the crawl
+        checkpoint and the frontier and budget to the checkpoint, so an
+        interrupted crawl with the same parameters resumes.
+
+        Parameters:
+        -----------
+        max_users : int
+            The maximum number of users to crawl, unlimited by default.
+        max_requests : int
+            The maximum number of user requests, unlimited by default.
+        priority : str
+            The priority strategy, a key of CRAWL_PRIORITIES.
+        friend_cap : int
+            The maximum number of new users one user adds to the frontier.
+        max_depth : int
+            If given, users at this distance from the root are crawled but not expanded.
+        max_in_flight : int
+            The maximum number of concurrent requests.
+        checkpoint_every : int
+            The number of users crawled between two checkpoints.
+        seed : int
+            The seed of the friend sampling.
+        stream_file : str
+            If given, every crawled user and game is also written to this NDJSON file.
+        '''
+        if self.cache.get('user_friend_graph'):
+            print("Cache already created.")
+            return
+        if priority not in CRAWL_PRIORITIES:
+            print(f"Unknown crawl priority {priority}, expected one of {', '.join(CRAWL_PRIORITIES)}.")
+            return
+        weight = CRAWL_PRIORITIES[priority]
+        max_users = float('inf') if max_users is None else max_users
+        max_requests = float('inf') if max_requests is None else max_requests
+
+        strategy = {"max_users": str(max_users), "max_requests": str(max_requests), "priority": priority,
+                    "friend_cap": friend_cap, "seed": seed}
+        state = self.checkpoint.load(self.root_user_id, max_depth, strategy)
+        if state is None:
+            self.checkpoint.clear()
+            frontier = PriorityFrontier()
+            frontier.push(self.root_user_id, 0, 0)
+            requests_used = 0
+        else:
+            frontier = PriorityFrontier.from_state(state["frontier"])
+            requests_used = state["requests"]
+        results = self.checkpoint.results()
+        friend_lists = CacheSection(results, 'friend_lists')
+        user_game_map = CacheSection(results, 'user_game_mapping')
+        fetched_at = CacheSection(results, 'user_fetched_at')
+        crawled = set(friend_lists)
+        if state is not None:
+            print(f"Resuming crawl, {len(crawled)} users done.")
+        stream = CrawlStream(stream_file, append=state is not None) if stream_file else None
+
+        since_checkpoint = 0
+        while frontier:
+            size = min(max_in_flight, max_users - len(crawled), (max_requests - requests_used) // 2)
+            if size < 1:
+                break
+            batch = frontier.take(int(size))
+            chunk = [id for id, _ in batch]
+            game_lists = self._fetch_all(self.get_game_list, chunk, max_in_flight)
+            batch_friends = self._fetch_all(self.get_friend_list, chunk, max_in_flight)
+            requests_used += 2 * len(chunk)
+            metrics.increment('crawl_users_total', len(chunk))
+            now = time.time()
+
+            for id, game_list, friend_list in zip(chunk, game_lists, batch_friends):
+                user_game_map[id] = self.filter_game_list(game_list)
+                fetched_at[id] = now
+                friend_lists[id] = friend_list
+                crawled.add(id)
+
+            for (id, depth), friend_list in zip(batch, batch_friends):
+                if max_depth is not None and depth >= max_depth:
+                    continue
+                user_weight = weight(user_game_map[id])
+                new_friends = []
+                for friend in friend_list:
+                    if friend in frontier:
+                        frontier.push(friend, user_weight, depth + 1)
+                    elif friend not in crawled:
+                        new_friends.append(friend)
+                if friend_cap is not None and len(new_friends) > friend_cap:
+                    new_friends = random.Random(f"{seed}:{id}").sample(new_friends, friend_cap)
+                for friend in new_friends:
+                    frontier.push(friend, user_weight, depth + 1)
+
+            if stream:
+                for id, friend_list in zip(chunk, batch_friends):
+                    stream.write_user(id, friend_list, user_game_map[id])
+                stream.flush()
+
+            since_checkpoint += len(chunk)
+            if since_checkpoint >= checkpoint_every:
+                since_checkpoint = 0
+                self.checkpoint.save({
+                    "root": self.root_user_id,
+                    "max_depth": max_depth,
+                    "strategy": strategy,
+                    "frontier": frontier.to_state(),
+                    "requests": requests_used
+                })
+        print(f"Crawled {len(crawled)} users with {requests_used} requests, {len(frontier)} left in the frontier.")
+
+        friend_tree = {id: [friend for friend in friend_list if friend in crawled]
+                       for id, friend_list in friend_lists.items()}
+        game_ids = [g["appid"] for games in user_game_map.values() for g in games]
+        game_detail = self.fetch_game_details(game_ids, max_in_flight)
+        if stream:
+            for game_id, detail in game_detail.items():
+                stream.write_app(game_id, detail)
+            stream.end()
 
+        self.cache.set('user_friend_graph', friend_tree)
+        self.cache.set('user_game_mapping', user_game_map)
+        self.cache.set('game_detail', game_detail)
+        self.cache.set('user_fetched_at', fetched_at)
+        self.cache.save_cache()
+        self.checkpoint.clear()
+
+
+    @metrics.timed('refresh')
+    def refresh_data(self, ttl, max_in_flight=1, checkpoint_every=500):
+        '''
+        Re-fetch the owned games and friends of every cached user whose data
+        is older than ttl seconds.
+
+        Refreshed friend lists are restricted to users already in the graph,
+        so the crawled network keeps its shape; games that appear for the
+        first time go through the app-detail stage. The cache is saved after
+        every chunk of checkpoint_every users, so an interrupted refresh only
+        re-fetches the users it had not reached.
+
+        Parameters:
+        -----------
+        ttl : float
+            The maximum age in seconds of a user's data.
+        max_in_flight : int
+            The maximum number of concurrent requests, 1 for a serial refresh.
+        checkpoint_every : int
+            The number of users refreshed between two saves of the cache.
+        '''
+        friend_tree = self.cache.get('user_friend_graph')
+        if not friend_tree:
+            print("No cache to refresh.")
+            return
+
+        user_game_map = self.cache.get('user_game_mapping')
+        game_detail = self.cache.get('game_detail')
+        fetched_at = self.cache.get('user_fetched_at') or {}
+
+        now = time.time()
+        stale = [id for id in friend_tree if now - fetched_at.get(id, 0) > ttl]
+        print(f"Refreshing {len(stale)} of {len(friend_tree)} users.")
+
+        for i in range(0, len(stale), checkpoint_every):
+            chunk = stale[i:i + checkpoint_every]
+            game_lists = self._fetch_all(self.get_game_list, chunk, max_in_flight)
+            friend_lists = self._fetch_all(self.get_friend_list, chunk, max_in_flight)
+            now = time.time()
+
+            for id, game_list, friend_list in zip(chunk, game_lists, friend_lists):
+                user_game_map[id] = self.filter_game_list(game_list)
+                friend_tree[id] = [friend for friend in friend_list if friend in friend_tree]
+            # Staged per chunk, so every save writes the timestamps of its own chunk
+            self.cache.update('user_fetched_at', {id: now for id in chunk})
+
+            new_game_ids = [g["appid"] for id in chunk for g in user_game_map[id]
+                            if g["appid"] not in game_detail and str(g["appid"]) not in game_detail]
+            for game_id, detail in self.fetch_game_details(new_game_ids, max_in_flight).items():
+                game_detail[str(game_id)] = detail
+            self.cache.save_cache()
+
+
+    def filter_game_list(self, game_list):
+        return [game_time for game_time in game_list if game_time["playtime_forever"] > 600]
+
+
+    @metrics.timed('game_details')
+    def fetch_game_details(self, game_ids, max_in_flight=1, batch_size=100):
+        '''
+        Fetch the details of the given games through the persistent detail store.
+
+        The game ids are deduplicated first. Only games the store has no
+        record of (or whose last request failed longer ago than the store's
+        retry delay) are requested, in batches of batch_size that are fetched
+        with up to max_in_flight concurrent requests. The store is saved after
+        every batch, so an interrupted stage keeps the details it already got.
+
+        Parameters:
+        -----------
+        game_ids : list
+            The game ids to look up, possibly with duplicates.
+        max_in_flight : int
+            The maximum number of concurrent requests.
+        batch_size : int
+            The number of games fetched between two saves of the store.
+
+        Returns:
+        --------
+        dict
+            A dictionary mapping each unique game id to its details, or None
+            if Steam has no data for the game.
+        '''
+        unique_ids = list(dict.fromkeys(game_ids))
+        missing = [game_id for game_id in unique_ids if self.detail_store.needs_fetch(game_id)]
+        if missing:
+            print(f"Fetching details for {len(missing)} of {len(unique_ids)} games.")
+
+        for i in range(0, len(missing), batch_size):
+            batch = missing[i:i + batch_size]
+            results = self._fetch_all(self.request_game_detail, batch, max_in_flight)
+            for game_id, (status, detail) in zip(batch, results):
+                if status == "ok":
+                    self.detail_store.set(game_id, detail)
+                else:
+                    self.detail_store.set_failed(game_id, status)
+            self.detail_store.save()
+
+        return {game_id: self.detail_store.get(game_id) for game_id in unique_ids}
+
+
+    def _fetch_all(self, fetch, items, max_in_flight):
+        if max_in_flight <= 1:
+            return [fetch(item) for item in items]
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            return list(pool.map(fetch, items))
 
 
-    
     def get_game_detail(self, game_id):
-        url = f"http://store.steampowered.com/api/appdetails?appids={game_id}"
-        response = requests.get(url)
+        return self.request_game_detail(game_id)[1]
+
+
+    def request_game_detail(self, game_id):
+        url = f"{self.store_url}/api/appdetails?appids={game_id}"
+        response = self.transport.get(url)
         if response.status_code == 200:
             data = response.json()
             if data[str(game_id)]['success']:
-                return data[str(game_id)]['data']
+                return "ok", data[str(game_id)]['data']
             else:
                 print(f"No game data available for game {game_id}.")
-                return None
+                return "unavailable", None
         else:
             print(response.status_code)
-            return None
+            return "error", None
 
 
     def get_game_list(self, user_id):
-        url = f"http://api.steampowered.com/IPlayerService/GetOwnedGames/v1/"
+        url = f"{self.api_url}/IPlayerService/GetOwnedGames/v1/"
         
         params = {
             'key': self.api_key, 
             'steamid': user_id, 
             'format': 'json'
         }
-        response = requests.get(url, params=params)
+        response = self.transport.get(url, params=params)
         
         if response.status_code == 200:
             data = response.json()
@@ -109,14 +480,14 @@ class SteamAPI:
     
 
     def get_friend_list(self, user_id):
-        url = f"http://api.steampowered.com/ISteamUser/GetFriendList/v0001/"
+        url = f"{self.api_url}/ISteamUser/GetFriendList/v0001/"
         params = {
             'key': self.api_key,
             'steamid': user_id,
             'relationship': 'friend',
             'format': 'json'
         }
-        response = requests.get(url, params=params)
+        response = self.transport.get(url, params=params)
         # print(f"Friends list API response for {steamid}: {response.status_code}")
         if response.status_code == 200:
             data = response.json()
@@ -130,11 +501,32 @@ class SteamAPI:
 
 
 
+def game_name_variants(game_name):
+    '''
+    Return the names under which a game is looked up on Twitch, most specific first.
+    '''
+    # Remove number at the end of the game name (if present)
+    game_name_no_number = re.sub(r'\s*\d+$', '', game_name)
+    # Remove sub-name after colon (if present)
+    game_name_no_subname = re.sub(r'\s*:.+', '', game_name_no_number)
+    # Remove content inside parentheses (if present)
+    game_name_no_parentheses = re.sub(r'\s*\([^)]*\)', '', game_name_no_subname)
+    names = [game_name, game_name_no_number, game_name_no_subname, game_name_no_parentheses]
+    return [name for name in dict.fromkeys(names) if name]
+
+
+
 class TwitchAPI:
-    def __init__(self, key_file_name):
+    def __init__(self, key_file_name, transport=None, id_cache=None, negative_ttl=7 * 24 * 3600,
+                 api_url=TWITCH_API_URL, auth_url=TWITCH_AUTH_URL):
         with open(key_file_name) as f:
             conf = json.load(f)
         
+        self.api_url = api_url
+        self.auth_url = auth_url
+        self.transport = transport if transport is not None else HTTPTransport()
+        self.id_cache = id_cache if id_cache is not None else APICache('twitch_cache.db')
+        self.negative_ttl = negative_ttl
         self.client_id = conf["twitch_client_id"]
         self.client_secret = conf["twitch_client_secret"]
         self.set_token()
@@ -145,13 +537,13 @@ class TwitchAPI:
     
 
     def set_token(self):
-        url = "https://id.twitch.tv/oauth2/token"
+        url = self.auth_url
         body = {
             'client_id': self.client_id,
             'client_secret': self.client_secret,
             'grant_type': 'client_credentials'
         }
-        response = requests.post(url, data=body)
+        response = self.transport.post(url, data=body)
         
         if response.status_code == 200:
             self.token = response.json()['access_token']
@@ -161,62 +553,91 @@ class TwitchAPI:
 
     
     def get_game_id(self, game_name):
-        base_url = 'https://api.twitch.tv/helix'
-        params = {
-            'name': game_name,
-            'first': 100
-        }
-        
-        try:
-            response = requests.get(f'{base_url}/games', headers=self.headers, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            if data['data']:
-                # If there are results for the original game name, return the game ID
-                return data['data'][0]['id']
+        entry = self._cached_game_id(game_name)
+        if entry is not None:
+            return entry["id"]
+        return self.resolve_game_ids([game_name]).get(game_name)
+
+
+    @metrics.timed('twitch_lookup')
+    def resolve_game_ids(self, game_names):
+        '''
+        Look up the Twitch game ids of many games, going to the API only for
+        names that are not in the resolution cache.
+
+        Every name is tried as is, without a trailing number, without a
+        subtitle and without parentheses, in that order. All variants are
+        sent as repeated name parameters of batched /games requests (at most
+        100 names per request) instead of one request per variant. Resolved
+        ids and misses are stored in the cache; misses expire after
+        negative_ttl seconds.
+
+        Parameters:
+        -----------
+        game_names : list
+            The game names to resolve.
+
+        Returns:
+        --------
+        dict
+            A dictionary mapping each game name to its Twitch id, or None if
+            no variant of the name is known to Twitch.
+        '''
+        resolved = {}
+        variants = {}
+        for game_name in dict.fromkeys(game_names):
+            entry = self._cached_game_id(game_name)
+            if entry is not None:
+                resolved[game_name] = entry["id"]
+            else:
+                variants[game_name] = game_name_variants(game_name)
 
-            # Remove number at the end of the game name (if present)
-            game_name_no_number = re.sub(r'\s*\d+$', '', game_name)
-            
-            response = requests.get(f'{base_url}/games', headers=self.headers, params={'name': game_name_no_number, 'first': 100})
-            response.raise_for_status()
-            data = response.json()
+        batch = []
+        for game_name, names in variants.items():
+            if len(batch) + len(names) > 100:
+                self._resolve_batch(batch, variants, resolved)
+                batch = []
+            batch += names
+        if batch:
+            self._resolve_batch(batch, variants, resolved)
 
-            if data['data']:
-                # If there are results after removing the number, return the game ID
-                return data['data'][0]['id']
+        self.id_cache.save_cache()
+        return resolved
 
-            # Remove sub-name after colon (if present)
-            game_name_no_subname = re.sub(r'\s*:.+', '', game_name_no_number)
 
-            response = requests.get(f'{base_url}/games', headers=self.headers, params={'name': game_name_no_subname, 'first': 100})
+    def _resolve_batch(self, names, variants, resolved):
+        params = [('name', name) for name in dict.fromkeys(names)] + [('first', 100)]
+        try:
+            response = self.transport.get(f'{self.api_url}/games', headers=self.headers, params=params)
             response.raise_for_status()
-            data = response.json()
-
-            if data['data']:
-                # If there are results after removing the sub-name, return the game ID
-                return data['data'][0]['id']
-            
-            # Remove content inside parentheses (if present)
-            game_name_no_parentheses = re.sub(r'\s*\([^)]*\)', '', game_name_no_subname)
+            ids = {}
+            for game in response.json()['data']:
+                ids.setdefault(game['name'].lower(), game['id'])
+        except requests.exceptions.RequestException as e:
+            print(f'Error occurred: {e}')
+            return
 
-            response = requests.get(f'{base_url}/games', headers=self.headers, params={'name': game_name_no_parentheses, 'first': 100})
-            response.raise_for_status()
-            data = response.json()
+        queried = set(names)
+        now = time.time()
+        for game_name, game_variants in variants.items():
+            if game_name in resolved or not queried.issuperset(game_variants):
+                continue
+            game_id = next((ids[name.lower()] for name in game_variants if name.lower() in ids), None)
+            resolved[game_name] = game_id
+            self.id_cache.update('twitch_game_ids', {game_name: {"id": game_id, "time": now}})
 
-            if data['data']:
-                # If there are results after removing the content inside parentheses, return the game ID
-                return data['data'][0]['id']
 
-            # If no results found, return None
+    def _cached_game_id(self, game_name):
+        entries = self.id_cache.get('twitch_game_ids')
+        if entries is None or game_name not in entries:
             return None
-
-        except requests.exceptions.RequestException as e:
-            print(f'Error occurred: {e}')
+        entry = entries[game_name]
+        if entry["id"] is None and time.time() - entry["time"] > self.negative_ttl:
             return None
+        return entry
 
 
+    @metrics.timed('twitch_streams')
     def get_popular_streams(self, game_name, limit=10):
         game_id = self.get_game_id(game_name)
         
@@ -224,14 +645,14 @@ class TwitchAPI:
             print(f'Failed to retrieve game ID for {game_name}')
             return None
         
-        base_url = 'https://api.twitch.tv/helix'
+        base_url = self.api_url
         params = {
             'game_id': game_id,
             'first': limit
         }
         
         try:
-            response = requests.get(f'{base_url}/streams', headers=self.headers, params=params)
+            response = self.transport.get(f'{base_url}/streams', headers=self.headers, params=params)
             response.raise_for_status()
             data = response.json()
             
@@ -253,29 +674,131 @@ class TwitchAPI:
 
 
 
-class APICache:
-    def __init__(self, cache_file='api_cache.json'):
-        self.cache_file = cache_file
-        self.data = self.load_cache()
-
-    def load_cache(self):
-        if os.path.exists(self.cache_file):
-            with open(self.cache_file, 'r') as file:
-                return json.load(file)
-        return {}
-    
-    def get(self, key):
-        if key not in self.data:
-            return None 
-        else:
-            return self.data[key]
-
-
-    def set(self, key, value):
-        self.data[key] = value
-
-    def save_cache(self):
-        with open(self.cache_file, 'w') as file:
-            json.dump(self.data, file, indent=4)
-
-
+class AppDetailStore:
+    '''
+    Persistent store of Steam app details shared across crawls.
+
+    Details are projected on the fields given (see project_detail) before
+    they are stored, and their entries are compressed. With archive set the
+    full payload is also kept, compressed, and can be read with get_raw.
+
+    Besides the details themselves the store remembers the apps whose
+    request failed. Apps reported as unavailable by Steam (success: false)
+    are never requested again, other failures are retried once retry_after
+    seconds have passed.
+    '''
+    def __init__(self, store_file='app_detail_store.db', retry_after=24 * 3600, fields=DETAIL_FIELDS, archive=False):
+        self.store = APICache(store_file, compressed_sections=("details", "raw"))
+        self.retry_after = retry_after
+        self.fields = fields
+        self.archive = archive
+
+    def get(self, game_id):
+        return project_detail(self._entry("details", game_id), self.fields)
+
+    def get_raw(self, game_id):
+        return self._entry("raw", game_id)
+
+    def set(self, game_id, detail):
+        self.store.update("details", {game_id: project_detail(detail, self.fields)})
+        if self.archive:
+            self.store.update("raw", {game_id: detail})
+
+    def set_failed(self, game_id, reason):
+        self.store.update("failed", {game_id: {"reason": reason, "time": time.time()}})
+
+    def needs_fetch(self, game_id):
+        details = self.store.get("details")
+        if details is not None and game_id in details:
+            return False
+        failure = self._entry("failed", game_id)
+        if failure is None:
+            return True
+        if failure["reason"] == "unavailable":
+            return False
+        return time.time() - failure["time"] > self.retry_after
+
+    def save(self):
+        self.store.save_cache()
+
+    def _entry(self, section, game_id):
+        entries = self.store.get(section)
+        if entries is None:
+            return None
+        return entries.get(str(game_id))
+
+
+
+def project_detail(detail, fields=DETAIL_FIELDS):
+    '''
+    Keep only the given top-level fields of an appdetails payload.
+
+    Parameters:
+    -----------
+    detail : dict
+        The payload, or None for an app without details.
+    fields : tuple
+        The fields to keep, or None to keep the whole payload.
+    '''
+    if detail is None or fields is None:
+        return detail
+    return {field: detail[field] for field in fields if field in detail}
+
+
+
+class CrawlCheckpoint:
+    '''
+    On-disk state of an unfinished crawl.
+
+    The results of the crawl (friend lists, game lists and fetch times) are
+    written chunk by chunk to an SQLite results store next to the
+    checkpoint file (see results), and the checkpoint file itself only
+    holds the frontier and the position of the crawl. Saving a checkpoint
+    therefore does not get slower as the crawl grows.
+    '''
+    def __init__(self, checkpoint_file='crawl_checkpoint.json'):
+        self.checkpoint_file = checkpoint_file
+        self.spill_dir = checkpoint_file + '.frontier'
+        self.results_file = checkpoint_file + '.db'
+        self.store = None
+
+    def results(self):
+        '''
+        Return the APICache holding the results of the crawl so far. Entries
+        staged in it are committed by the next save.
+        '''
+        if self.store is None:
+            self.store = APICache(self.results_file, compressed_sections=())
+        return self.store
+
+    def load(self, root_user_id, max_depth, strategy=None):
+        if self.store is not None:
+            # Drop results staged after the last save, the checkpoint does not cover them
+            self.store.conn.close()
+            self.store = None
+        if not os.path.exists(self.checkpoint_file):
+            return None
+        with open(self.checkpoint_file, 'r') as file:
+            state = json.load(file)
+        if state["root"] != root_user_id or state["max_depth"] != max_depth or state.get("strategy") != strategy:
+            print("Ignoring checkpoint of a different crawl.")
+            return None
+        return state
+
+    def save(self, state):
+        # The results go first, so a checkpoint never points past results that were not written
+        if self.store is not None:
+            self.store.save_cache()
+        tmp_file = self.checkpoint_file + '.tmp'
+        with open(tmp_file, 'w') as file:
+            json.dump(state, file)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def clear(self):
+        if self.store is not None:
+            self.store.conn.close()
+            self.store = None
+        for path in (self.checkpoint_file, self.results_file, self.results_file + '-wal', self.results_file + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
@@ -0,0 +1,237 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+from snapshot import compile_snapshot
+
+
+def modified_sigmoid(x):
+    '''
+    Vectorized form of the playtime weighting used by GameNode.set_node_interests.
+    '''
+    return 0.5 * (1 / (1 + np.exp(-0.001 * np.asarray(x, dtype=np.float64)))) + 0.5
+
+
+
+def segment_sum(values, indptr):
+    '''
+    Sum the rows of values in the segments delimited by a CSR indptr.
+
+    Parameters:
+    -----------
+    values : np.ndarray
+        A 1-D or 2-D array with indptr[-1] rows.
+    indptr : np.ndarray
+        The segment boundaries.
+
+    Returns:
+    --------
+    np.ndarray
+        One row per segment, zero for empty segments.
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    indptr = np.asarray(indptr)
+    out = np.zeros((len(indptr) - 1,) + values.shape[1:])
+    starts = indptr[:-1]
+    nonempty = indptr[1:] > starts
+    if nonempty.any():
+        out[nonempty] = np.add.reduceat(values, starts[nonempty], axis=0)
+    return out
+
+
+
+class ArrayGraph(Mapping):
+    '''
+    Array-backed alternative to the dictionary of Node/GameNode objects
+    returned by build_graph.
+
+    Users and games are integer ids into the tables of a Snapshot, with
+    separate CSR arrays for user-user and user-game edges. User interests are
+    rows of a dense users x genres matrix (0 meaning "no interest"), and
+    every game has a float32 vector holding the mean playtime score of its
+    owners at the positions of its genres.
+    Indexing the graph by Steam id returns a lightweight UserView that
+    behaves like a Node, so propagate_interests, recommend_users and
+    recommend_games run against an ArrayGraph unchanged.
+
+    Attributes:
+    ----------
+    snapshot : Snapshot
+        The id tables and adjacency arrays.
+    user_interests : np.ndarray
+        float64 matrix of the interest scores of every user.
+    game_vectors : np.ndarray
+        float32 games x genres matrix of game interest vectors.
+    user_game_mapping : Mapping
+        A user_game_mapping-like view, for recommend_games.
+    '''
+    __slots__ = ('snapshot', 'vocabulary', 'user_interests', 'game_vectors', 'user_game_mapping', '_id_to_index')
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.vocabulary = snapshot.vocabulary
+        self.user_interests = np.zeros((snapshot.num_users, len(snapshot.genres)), dtype=np.float64)
+        self.game_vectors = game_vectors(snapshot)
+        self.user_game_mapping = UserGameMapping(self)
+        self._id_to_index = None
+
+    @classmethod
+    def from_mappings(cls, user_friend_graph, user_game_mapping, game_detail):
+        return cls(compile_snapshot(user_friend_graph, user_game_mapping, game_detail))
+
+    def index(self, user_id):
+        if self._id_to_index is None:
+            self._id_to_index = {str(user_id): i for i, user_id in enumerate(self.snapshot.user_ids.tolist())}
+        return self._id_to_index[str(user_id)]
+
+    def __getitem__(self, user_id):
+        return UserView(self, self.index(user_id))
+
+    def __contains__(self, user_id):
+        try:
+            self.index(user_id)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return (str(user_id) for user_id in self.snapshot.user_ids.tolist())
+
+    def __len__(self):
+        return self.snapshot.num_users
+
+    def items(self):
+        return ((str(user_id), UserView(self, i)) for i, user_id in enumerate(self.snapshot.user_ids.tolist()))
+
+    def set_interests(self, user, interests):
+        row = np.zeros(len(self.vocabulary), dtype=np.float64)
+        for genre, score in interests:
+            row[self.vocabulary.index[genre]] = score
+        self.user_interests[user] = row
+
+
+
+def game_vectors(snapshot):
+    '''
+    Compute the interest vector of every game: the mean modified_sigmoid
+    playtime score of its owners at the positions of its genres, as
+    GameNode.set_node_interests does one owner at a time.
+
+    Returns:
+    --------
+    np.ndarray
+        float32 games x genres matrix.
+    '''
+    owned = np.asarray(snapshot.own_indices)
+    counts = np.bincount(owned, minlength=snapshot.num_games)
+    totals = np.bincount(owned, weights=modified_sigmoid(snapshot.own_playtime), minlength=snapshot.num_games)
+    means = np.divide(totals, counts, out=np.zeros(snapshot.num_games), where=counts > 0)
+
+    vectors = np.zeros((snapshot.num_games, len(snapshot.genres)), dtype=np.float32)
+    game_of = np.repeat(np.arange(snapshot.num_games), np.diff(snapshot.game_genre_indptr))
+    vectors[game_of, np.asarray(snapshot.game_genre_indices)] = means[game_of]
+    return vectors
+
+
+
+class UserView:
+    '''
+    Node-like view of one user of an ArrayGraph.
+    '''
+    __slots__ = ('graph', 'index')
+
+    def __init__(self, graph, index):
+        self.graph = graph
+        self.index = index
+
+    @property
+    def id(self):
+        return str(self.graph.snapshot.user_ids[self.index])
+
+    @property
+    def friends(self):
+        snapshot = self.graph.snapshot
+        games, _ = snapshot.games(self.index)
+        return ([GameView(self.graph, int(game)) for game in games] +
+                [UserView(self.graph, int(friend)) for friend in snapshot.friends(self.index)])
+
+    @property
+    def interests(self):
+        return self.graph.vocabulary.interests(self.graph.user_interests[self.index])
+
+    def set_node_interests(self, interests):
+        self.graph.set_interests(self.index, interests)
+
+    def is_game_node(self):
+        return False
+
+    def owns_games(self):
+        snapshot = self.graph.snapshot
+        return snapshot.own_indptr[self.index + 1] > snapshot.own_indptr[self.index]
+
+    def __eq__(self, other):
+        return isinstance(other, UserView) and other.graph is self.graph and other.index == self.index
+
+    def __hash__(self):
+        return hash((False, self.index))
+
+
+
+class GameView:
+    '''
+    GameNode-like view of one game of an ArrayGraph.
+    '''
+    __slots__ = ('graph', 'index')
+
+    friends = ()
+
+    def __init__(self, graph, index):
+        self.graph = graph
+        self.index = index
+
+    @property
+    def id(self):
+        return int(self.graph.snapshot.game_ids[self.index])
+
+    @property
+    def vocabulary(self):
+        return self.graph.vocabulary
+
+    @property
+    def vector(self):
+        return self.graph.game_vectors[self.index]
+
+    @property
+    def interests(self):
+        return self.graph.vocabulary.interests(self.vector)
+
+    def is_game_node(self):
+        return True
+
+    def __eq__(self, other):
+        return isinstance(other, GameView) and other.graph is self.graph and other.index == self.index
+
+    def __hash__(self):
+        return hash((True, self.index))
+
+
+
+class UserGameMapping(Mapping):
+    '''
+    Read-only user_game_mapping view of an ArrayGraph: maps a Steam id to the
+    list of {"appid", "playtime_forever"} records of the user.
+    '''
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, user_id):
+        snapshot = self.graph.snapshot
+        games, playtimes = snapshot.games(self.graph.index(user_id))
+        return [{"appid": int(snapshot.game_ids[game]), "playtime_forever": int(playtime)}
+                for game, playtime in zip(games, playtimes)]
+
+    def __iter__(self):
+        return iter(self.graph)
+
+    def __len__(self):
+        return len(self.graph)
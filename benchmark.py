@@ -0,0 +1,150 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from array_graph import ArrayGraph
+from collaborative import GameRecommender
+from propagation import propagate_interests_all, propagate_interests_matrix
+from similarity import SimilarityEngine
+from synthetic import generate_network, network_mappings, network_snapshot
+
+
+def measure(stage, size, function, memory=True):
+    '''
+    Run one benchmark stage, timing it and, with memory set, running it a
+    second time under tracemalloc to record its peak allocation.
+
+    Returns:
+    --------
+    tuple
+        The result of the stage and the measurement record.
+    '''
+    start = time.perf_counter()
+    try:
+        result = function()
+    except RecursionError:
+        return None, {'size': size, 'stage': stage, 'seconds': None, 'peak_mb': None, 'error': 'RecursionError'}
+    record = {'size': size, 'stage': stage, 'seconds': time.perf_counter() - start, 'peak_mb': None}
+
+    if memory:
+        tracemalloc.start()
+        function()
+        record['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result, record
+
+
+
+def benchmark_arrays(network, memory=True):
+    '''
+    Benchmark the array pipeline: snapshot, propagation from the root and for
+    all users, similar users and collaborative-filtering games of the root.
+    '''
+    size = len(network['user_ids'])
+    root = str(network['user_ids'][0])
+    records = []
+
+    def run(stage, function):
+        result, record = measure(stage, size, function, memory)
+        records.append(record)
+        return result
+
+    snapshot = run('compile_snapshot', lambda: network_snapshot(network))
+    graph = run('array_graph', lambda: ArrayGraph(snapshot))
+    run('propagate_interests_matrix', lambda: propagate_interests_matrix(graph, root))
+    run('propagate_interests_all', lambda: propagate_interests_all(graph))
+    engine = run('similarity_engine', lambda: SimilarityEngine.from_graph(graph))
+    run('recommend_users', lambda: engine.recommend(root, 5))
+    games = GameRecommender(snapshot, engine)
+    run('recommend_games', lambda: games.recommend(0, 5))
+    return [dict(record, pipeline='arrays') for record in records]
+
+
+
+def benchmark_objects(network, memory=True):
+    '''
+    Benchmark the Node pipeline of graph.py: build_graph, propagate_interests,
+    perform_aggregation over the neighbourhood of every user, recommend_users
+    and recommend_games.
+    '''
+    import graph as object_graph
+
+    size = len(network['user_ids'])
+    root = str(network['user_ids'][0])
+    user_friend_graph, user_game_mapping, game_detail = network_mappings(network)
+    game_interests = {game_id: [item["description"] for item in detail["genres"]]
+                      for game_id, detail in game_detail.items() if detail}
+    records = []
+
+    def run(stage, function):
+        result, record = measure(stage, size, function, memory)
+        records.append(record)
+        return result
+
+    # propagate_interests recurses once per user on its depth-first path
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * size))
+    nodes = run('build_graph', lambda: object_graph.build_graph(user_friend_graph, user_game_mapping, game_interests))
+    run('propagate_interests', lambda: object_graph.propagate_interests(nodes[root]))
+    run('perform_aggregation', lambda: [object_graph.perform_aggregation(node.friends) for node in nodes.values()])
+    users = run('recommend_users', lambda: object_graph.recommend_users(nodes, root))
+    if users:
+        run('recommend_games', lambda: object_graph.recommend_games(users[0][0], 5, user_game_mapping))
+    return [dict(record, pipeline='objects') for record in records]
+
+
+
+def run_benchmark(sizes=(1000, 10000, 100000), seed=0, memory=True, object_limit=100000):
+    '''
+    Benchmark every stage on synthetic networks of the given sizes.
+
+    Parameters:
+    -----------
+    sizes : list
+        The numbers of users of the generated networks.
+    seed : int
+        The seed of the generated networks.
+    memory : bool
+        Whether to also record the peak memory of every stage.
+    object_limit : int
+        The largest network the Node pipeline is benchmarked on.
+
+    Returns:
+    --------
+    list
+        One record per size and stage with its pipeline, seconds and peak_mb.
+    '''
+    results = []
+    for size in sizes:
+        network = generate_network(size, seed)
+        results.extend(benchmark_arrays(network, memory))
+        if size <= object_limit:
+            results.extend(benchmark_objects(network, memory))
+    return results
+
+
+
+def print_results(results):
+    print(f"{'users':>9}  {'pipeline':<8}  {'stage':<28}{'seconds':>10}{'peak MB':>10}")
+    for record in results:
+        seconds = record.get('error') or f"{record['seconds']:.4f}"
+        peak = '' if record['peak_mb'] is None else f"{record['peak_mb']:.1f}"
+        print(f"{record['size']:>9}  {record['pipeline']:<8}  {record['stage']:<28}{seconds:>10}{peak:>10}")
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time and memory-profile the recommendation stages on synthetic networks.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', dest='memory', action='store_false')
+    parser.add_argument('--object-limit', type=int, default=100000,
+                        help="largest network the Node pipeline of graph.py is run on")
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.sizes, args.seed, args.memory, args.object_limit)
+    print_results(results)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=4)
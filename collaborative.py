@@ -0,0 +1,145 @@
+import numpy as np
+
+from similarity import top_k
+
+
+class GameRecommender:
+    '''
+    Collaborative-filtering game recommendations over the sparse user x game
+    playtime matrix of a Snapshot.
+
+    The ownership CSR arrays of the snapshot are the matrix: row u holds the
+    games of user u, weighted by log(1 + playtime) so a few very long
+    playtimes do not drown everything else. A game's score for a user is
+    the sum over the user's k most similar users of their similarity times
+    their weight for the game. Games the user already owns are never
+    recommended.
+
+    Users are scored in batches of bounded size: one matrix product gives
+    the neighbours of the whole batch, their matrix rows are gathered into
+    one flat array, and the scores are accumulated with a single bincount,
+    so no Python code runs per user or per game.
+
+    Attributes:
+    ----------
+    snapshot : Snapshot
+        The snapshot holding the ownership matrix.
+    engine : SimilarityEngine
+        The similarity engine over the users of the snapshot, in snapshot order.
+    neighbours : int
+        The number of similar users whose games are scored.
+    batch_size : int
+        The number of users scored at once, small enough for the dense
+        batch x users similarity and batch x games score matrices to stay
+        around 128 MB.
+    '''
+    def __init__(self, snapshot, engine, neighbours=20):
+        self.snapshot = snapshot
+        self.engine = engine
+        self.neighbours = neighbours
+        self.batch_size = max(1, min(4096, (1 << 24) // max(snapshot.num_games, snapshot.num_users, 1)))
+        self.indptr = np.asarray(snapshot.own_indptr, dtype=np.int64)
+        self.indices = np.asarray(snapshot.own_indices, dtype=np.int64)
+        self.weights = np.log1p(np.asarray(snapshot.own_playtime, dtype=np.float64))
+
+    def _rows(self, users):
+        '''
+        Gather the matrix rows of the given users into flat (owner position, game, weight) arrays.
+        '''
+        starts = self.indptr[users]
+        lengths = self.indptr[np.asarray(users) + 1] - starts
+        owner = np.repeat(np.arange(len(starts)), lengths)
+        positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + starts[owner]
+        return owner, self.indices[positions], self.weights[positions]
+
+    def recommend_many(self, users, n=5):
+        '''
+        Score the unowned games of many users, batch_size users at a time.
+
+        Parameters:
+        -----------
+        users : np.ndarray
+            The snapshot indices of the users.
+        n : int
+            The number of games to recommend to each user.
+
+        Returns:
+        --------
+        tuple
+            Two len(users) x n matrices: the recommended game indices (-1
+            where fewer than n games could be scored) and their scores.
+        '''
+        users = np.asarray(users, dtype=np.int64)
+        games = np.full((len(users), n), -1, dtype=np.int64)
+        scores = np.zeros((len(users), n))
+        for start in range(0, len(users), self.batch_size):
+            batch = users[start:start + self.batch_size]
+            best, similarity = self.engine.neighbours(batch, self.neighbours)
+            batch_games, batch_scores = self.score(batch, best, similarity, n)
+            games[start:start + len(batch), :batch_games.shape[1]] = batch_games
+            scores[start:start + len(batch), :batch_scores.shape[1]] = batch_scores
+        return games, scores
+
+    def score(self, users, best, similarity, n=5):
+        '''
+        Score the unowned games of a batch of users from their already
+        known neighbours, as returned by SimilarityEngine.neighbours.
+
+        Returns:
+        --------
+        tuple
+            The recommended game indices and their scores, as recommend_many.
+        '''
+        users = np.asarray(users, dtype=np.int64)
+        num_games = self.snapshot.num_games
+        similarity = np.where(similarity > 0, similarity, 0.0)
+
+        owner, games, weights = self._rows(best.ravel())
+        batch_row = owner // best.shape[1]
+        scores = np.bincount(batch_row * num_games + games, weights=similarity.ravel()[owner] * weights,
+                             minlength=len(users) * num_games).reshape(len(users), num_games)
+
+        owner, games, _ = self._rows(users)
+        scores[owner, games] = 0.0
+
+        top = top_k(scores, n)
+        top_scores = np.take_along_axis(scores, top, axis=-1)
+        return np.where(top_scores > 0, top, -1), top_scores
+
+    def recommend(self, user, n=5):
+        '''
+        Return the n best unowned games of one user (a snapshot index) as (game index, score) tuples.
+        '''
+        games, scores = self.recommend_many([user], n)
+        return [(int(game), float(score)) for game, score in zip(games[0], scores[0]) if game >= 0]
+
+    def recommend_all(self, n=5, batch_size=None, neighbours=None):
+        '''
+        Recommend n games to every user of the snapshot.
+
+        The users are processed in batches of batch_size (self.batch_size by
+        default). The neighbours of all users can be passed in when they are
+        already known (e.g. from parallel.similar_users_parallel with k of at
+        least self.neighbours); only their first self.neighbours columns are
+        used.
+
+        Returns:
+        --------
+        tuple
+            The int32 users x n matrix of game indices (-1 for none) and the
+            float32 matrix of their scores.
+        '''
+        num_users = self.snapshot.num_users
+        batch_size = batch_size or self.batch_size
+        games = np.full((num_users, n), -1, dtype=np.int32)
+        scores = np.zeros((num_users, n), dtype=np.float32)
+        for start in range(0, num_users, batch_size):
+            users = np.arange(start, min(start + batch_size, num_users))
+            if neighbours is None:
+                batch_games, batch_scores = self.recommend_many(users, n)
+            else:
+                batch_games, batch_scores = self.score(users, neighbours[0][users, :self.neighbours],
+                                                       neighbours[1][users, :self.neighbours], n)
+            games[users, :batch_games.shape[1]] = batch_games
+            scores[users, :batch_scores.shape[1]] = batch_scores
+        return games, scores
@@ -0,0 +1,8 @@
+import time
+from store import APICache
+from snapshot import compile_cache
+
+start = time.perf_counter()
+snapshot = compile_cache(APICache(), "graph_snapshot")
+print(f"Compiled {snapshot.num_users} users, {snapshot.num_games} games and {len(snapshot.genres)} genres "
+      f"in {time.perf_counter() - start:.2f}s.")
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from api import CRAWL_PRIORITIES, AppDetailStore, CrawlCheckpoint, SteamAPI, TwitchAPI
+from fake_api import FakeSteamTwitch, start_fake_server
+from store import APICache
+from synthetic import generate_network
+from transport import HTTPTransport
+
+
+def run_crawl_benchmark(num_users=2000, max_depth=2, max_in_flight=8, latency=0.02, error_rate=0.02,
+                        throttle_rate=0.01, rate=None, seed=0, twitch_games=50, max_requests=None,
+                        priority='shared_friends', friend_cap=None):
+    '''
+    Crawl a synthetic network through the fake Steam and Twitch APIs and
+    measure the crawler.
+
+    A fake API server is started on a local port, and SteamAPI.get_data
+    crawls it from the first user with fresh cache, detail store and
+    checkpoint files in a temporary directory, removed afterwards. The Twitch ids of the first
+    twitch_games crawled games are then resolved and their streams fetched.
+    Retries are taken from the HTTPTransport counters. With max_requests,
+    the crawl is SteamAPI.get_data_budgeted with that budget, the priority
+    strategy and the friend cap, limited to max_depth.
+
+    Parameters:
+    -----------
+    num_users : int
+        The number of users of the synthetic network.
+    max_depth : int
+        The depth of the crawl.
+    max_in_flight : int
+        The maximum number of concurrent requests of the crawler.
+    latency : float
+        The latency in seconds of every fake API response.
+    error_rate, throttle_rate : float
+        The share of responses that are a 5xx or a 429.
+    rate : float
+        The server-side rate limit in requests per second, unlimited by default.
+    max_requests : int
+        The user request budget of a budgeted crawl, None for get_data.
+    priority, friend_cap
+        The priority strategy and friend cap of a budgeted crawl.
+
+    Returns:
+    --------
+    dict
+        The crawled users, friendships and owned games, the wall time,
+        requests, requests per second, retries and errors of the Steam crawl
+        and of the Twitch stage, and the per-endpoint counters.
+    '''
+    api = FakeSteamTwitch(generate_network(num_users, seed), latency, latency / 2, error_rate, throttle_rate,
+                          rate, seed=seed)
+    server, url = start_fake_server(api)
+    try:
+        with tempfile.TemporaryDirectory(prefix='crawl_benchmark_') as work_dir:
+            report = crawl(api, url, work_dir, max_depth, max_in_flight, twitch_games, max_requests, priority,
+                           friend_cap)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return report
+
+
+
+def crawl(api, url, work_dir, max_depth, max_in_flight, twitch_games, max_requests, priority, friend_cap):
+    '''
+    Run the Steam crawl and the Twitch stage of run_crawl_benchmark with their files in work_dir.
+    '''
+    key_file = os.path.join(work_dir, 'key.conf')
+    with open(key_file, 'w') as file:
+        json.dump({"api_key": "fake", "steam_id": str(api.user_ids[0]),
+                   "twitch_client_id": "fake", "twitch_client_secret": "fake"}, file)
+
+    transport = HTTPTransport(max_retries=8, backoff_base=0.01, backoff_max=0.5, pool_size=max(max_in_flight, 10))
+    cache = APICache(os.path.join(work_dir, 'api_cache.db'))
+    steam = SteamAPI(key_file, cache, AppDetailStore(os.path.join(work_dir, 'app_detail_store.db')),
+                     CrawlCheckpoint(os.path.join(work_dir, 'crawl_checkpoint.json')), transport,
+                     api_url=url, store_url=url)
+    start = time.perf_counter()
+    if max_requests is None:
+        steam.get_data(max_depth, max_in_flight)
+    else:
+        steam.get_data_budgeted(max_requests=max_requests, priority=priority, friend_cap=friend_cap,
+                                max_depth=max_depth, max_in_flight=max_in_flight)
+    wall_time = time.perf_counter() - start
+    friend_tree = cache.get('user_friend_graph')
+    report = {'users': len(friend_tree),
+              'friendships': sum(len(friends) for friends in friend_tree.values()) // 2,
+              'owned_games': sum(len(games) for games in cache.get('user_game_mapping').values()),
+              'steam': stage_report(transport, wall_time)}
+
+    transport = HTTPTransport(max_retries=8, backoff_base=0.01, backoff_max=0.5)
+    start = time.perf_counter()
+    twitch = TwitchAPI(key_file, transport, APICache(os.path.join(work_dir, 'twitch_cache.db')),
+                       api_url=url + '/helix', auth_url=url + '/oauth2/token')
+    names = [detail["name"] for detail in cache.get('game_detail').values() if detail][:twitch_games]
+    twitch.resolve_game_ids(names)
+    for name in names:
+        twitch.get_popular_streams(name)
+    report['twitch'] = stage_report(transport, time.perf_counter() - start)
+    return report
+
+
+
+def stage_report(transport, wall_time):
+    endpoints = transport.summary()
+    requests = sum(stats['requests'] for stats in endpoints.values())
+    return {
+        'wall_seconds': round(wall_time, 3),
+        'requests': requests,
+        'requests_per_second': round(requests / wall_time, 1) if wall_time > 0 else None,
+        'retries': sum(stats['retries'] for stats in endpoints.values()),
+        'errors': sum(stats['errors'] for stats in endpoints.values()),
+        'endpoints': endpoints,
+    }
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the crawler against local fake Steam and Twitch APIs.")
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--in-flight', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.02)
+    parser.add_argument('--throttle-rate', type=float, default=0.01)
+    parser.add_argument('--rate', type=float, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--budget', type=int, default=None, help="request budget of a budgeted crawl")
+    parser.add_argument('--priority', default='shared_friends', choices=sorted(CRAWL_PRIORITIES))
+    parser.add_argument('--friend-cap', type=int, default=None)
+    parser.add_argument('--no-baseline', action='store_true', help="skip the zero-latency baseline crawl")
+    args = parser.parse_args()
+
+    def run(latency, error_rate, throttle_rate, rate):
+        return run_crawl_benchmark(args.users, args.depth, args.in_flight, latency, error_rate, throttle_rate, rate,
+                                   args.seed, max_requests=args.budget, priority=args.priority,
+                                   friend_cap=args.friend_cap)
+
+    report = run(args.latency, args.error_rate, args.throttle_rate, args.rate)
+    # The same crawl without latency, faults or rate limit: the overhead of the crawler and the fake server.
+    baseline = None if args.no_baseline else run(0.0, 0.0, 0.0, None)
+    print(f"Crawled {report['users']} users, {report['friendships']} friendships, {report['owned_games']} owned games.")
+    for stage in ('steam', 'twitch'):
+        for name, result in (('', report), (' baseline', baseline)):
+            if result is not None:
+                stats = result[stage]
+                print(f"{stage + name:>15}: {stats['wall_seconds']:.2f}s, {stats['requests']} requests, "
+                      f"{stats['requests_per_second']} req/s, {stats['retries']} retries, {stats['errors']} errors")
@@ -0,0 +1,267 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from synthetic import generate_network
+
+
+class FakeSteamTwitch:
+    '''
+    Local stand-in for the Steam Web API, the Steam store and the Twitch
+    Helix API, serving a synthetic network (see synthetic.py).
+
+    Covered endpoints, all on one host:
+
+    GET  /IPlayerService/GetOwnedGames/v1/?steamid=
+    GET  /ISteamUser/GetFriendList/v0001/?steamid=
+    GET  /api/appdetails?appids=
+    POST /oauth2/token
+    GET  /helix/games?name=...&name=...
+    GET  /helix/streams?game_id=&first=
+
+    Every request waits latency seconds (plus up to jitter more) and may be
+    answered with a 5xx with probability error_rate, or a 429 with
+    probability throttle_rate or when the server-side rate limit of rate
+    requests per second (burst requests of burst) is exceeded.
+
+    Attributes:
+    ----------
+    network : dict
+        The synthetic network served.
+    stats : dict
+        A dictionary mapping "path status" to the number of responses sent.
+    '''
+    def __init__(self, network, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 rate=None, burst=10, retry_after=0, seed=0):
+        self.network = network
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate = rate
+        self.burst = burst
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.stats = {}
+
+        self.user_ids = network['user_ids']
+        self.game_ids = network['game_ids'].tolist()
+        self.game_index = {game_id: i for i, game_id in enumerate(self.game_ids)}
+        self.game_names = {detail["name"].lower(): game_id
+                           for game_id, detail in zip(self.game_ids, network['game_details']) if detail}
+
+    def fault(self):
+        '''
+        Draw the injected fault of one request: None, 429 or a 5xx status.
+        '''
+        with self.lock:
+            if self.rate is not None:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens < 1:
+                    return 429
+                self.tokens -= 1
+            draw = self.random.random()
+            if draw < self.error_rate:
+                return self.random.choice([500, 502, 503])
+            if draw < self.error_rate + self.throttle_rate:
+                return 429
+            return None
+
+    def delay(self):
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def record(self, path, status):
+        key = f"{path} {status}"
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def user(self, steam_id):
+        try:
+            user = int(steam_id) - int(self.user_ids[0])
+        except (TypeError, ValueError):
+            return None
+        return user if 0 <= user < len(self.user_ids) else None
+
+    def owned_games(self, query):
+        user = self.user(query.get('steamid', [None])[0])
+        if user is None:
+            return 400, {}
+        network = self.network
+        start, end = network['own_indptr'][user], network['own_indptr'][user + 1]
+        games = [{"appid": self.game_ids[game], "playtime_forever": playtime}
+                 for game, playtime in zip(network['own_indices'][start:end].tolist(),
+                                           network['own_playtime'][start:end].tolist())]
+        return 200, {"response": {"game_count": len(games), "games": games} if games else {}}
+
+    def friend_list(self, query):
+        user = self.user(query.get('steamid', [None])[0])
+        if user is None:
+            return 400, {}
+        network = self.network
+        friends = network['friend_indices'][network['friend_indptr'][user]:network['friend_indptr'][user + 1]]
+        return 200, {"friendslist": {"friends": [{"steamid": str(self.user_ids[friend]), "relationship": "friend",
+                                                  "friend_since": 0} for friend in friends.tolist()]}}
+
+    def app_details(self, query):
+        app_id = query.get('appids', [''])[0]
+        game = self.game_index.get(int(app_id)) if app_id.isdigit() else None
+        detail = self.network['game_details'][game] if game is not None else None
+        if detail is None:
+            return 200, {app_id: {"success": False}}
+        return 200, {app_id: {"success": True, "data": full_detail(detail, int(app_id))}}
+
+    def token(self, query):
+        return 200, {"access_token": "fake-token", "expires_in": 5000000, "token_type": "bearer"}
+
+    def twitch_games(self, query):
+        data = []
+        for name in query.get('name', []):
+            game_id = self.game_names.get(name.lower())
+            if game_id is not None and game_id % 3:  # about a third of the games are not on Twitch
+                data.append({"id": str(game_id), "name": name, "box_art_url": ""})
+        return 200, {"data": data}
+
+    def twitch_streams(self, query):
+        game_id = query.get('game_id', ['0'])[0]
+        first = int(query.get('first', ['20'])[0])
+        rng = random.Random(game_id)
+        streams = [{"id": str(rng.randrange(10 ** 9)), "user_name": f"streamer_{rng.randrange(10 ** 5)}",
+                    "game_id": game_id, "title": f"Stream {i}", "viewer_count": rng.randrange(10 ** 4),
+                    "language": "en", "started_at": "2024-01-01T00:00:00Z", "thumbnail_url": ""}
+                   for i in range(min(first, rng.randrange(50)))]
+        streams.sort(key=lambda stream: -stream["viewer_count"])
+        return 200, {"data": streams}
+
+
+
+def full_detail(detail, app_id):
+    '''
+    Pad the name and genres of a synthetic game with the bulk of a real
+    appdetails payload: HTML descriptions, requirements, screenshots and
+    movies, deterministic per app.
+    '''
+    rng = random.Random(app_id)
+    words = ["adventure", "explore", "world", "battle", "craft", "story", "friends", "online", "quest", "build"]
+    paragraphs = ''.join(f"<p>{' '.join(rng.choice(words) for _ in range(rng.randrange(40, 120)))}.</p>"
+                         for _ in range(rng.randrange(3, 12)))
+    media = f"https://cdn.akamai.steamstatic.com/steam/apps/{app_id}"
+    return dict(detail, type="game", steam_appid=app_id, required_age=0, is_free=rng.random() < 0.1,
+                detailed_description=paragraphs, about_the_game=paragraphs,
+                short_description=paragraphs[:300], supported_languages="English<strong>*</strong>, French, German",
+                header_image=f"{media}/header.jpg",
+                pc_requirements={"minimum": "<strong>Minimum:</strong><br><ul><li>OS: Windows 10</li>"
+                                            f"<li>Memory: {rng.choice([4, 8, 16])} GB RAM</li></ul>"},
+                developers=[f"Studio {rng.randrange(1000)}"], publishers=[f"Publisher {rng.randrange(300)}"],
+                categories=[{"id": 2, "description": "Single-player"}, {"id": 1, "description": "Multi-player"}],
+                screenshots=[{"id": i, "path_thumbnail": f"{media}/ss_{rng.getrandbits(64):016x}.600x338.jpg",
+                              "path_full": f"{media}/ss_{rng.getrandbits(64):016x}.1920x1080.jpg"}
+                             for i in range(rng.randrange(5, 20))],
+                movies=[{"id": rng.randrange(10 ** 8), "name": "Trailer", "thumbnail": f"{media}/movie.jpg",
+                         "webm": {"480": f"{media}/movie480.webm", "max": f"{media}/movie_max.webm"}}
+                        for _ in range(rng.randrange(0, 4))],
+                release_date={"coming_soon": False, "date": "1 Jan, 2020"})
+
+
+
+ROUTES = {
+    ('GET', '/IPlayerService/GetOwnedGames/v1/'): FakeSteamTwitch.owned_games,
+    ('GET', '/ISteamUser/GetFriendList/v0001/'): FakeSteamTwitch.friend_list,
+    ('GET', '/api/appdetails'): FakeSteamTwitch.app_details,
+    ('POST', '/oauth2/token'): FakeSteamTwitch.token,
+    ('GET', '/helix/games'): FakeSteamTwitch.twitch_games,
+    ('GET', '/helix/streams'): FakeSteamTwitch.twitch_streams,
+}
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # The headers and the body are sent separately; with Nagle's algorithm
+    # the body waits for the client's delayed ACK of the headers, about
+    # 40 ms per request on a kept-alive connection.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._serve('GET')
+
+    def do_POST(self):
+        self._serve('POST')
+
+    def _serve(self, method):
+        api = self.server.api
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode() if length else ''
+        query = parse_qs(url.query)
+        query.update(parse_qs(body))
+
+        api.delay()
+        route = ROUTES.get((method, url.path))
+        status = api.fault() if route is not None else 404
+        if status is None:
+            status, payload = route(api, query)
+        else:
+            payload = {"error": status}
+        api.record(url.path, status)
+
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if status == 429:
+            self.send_header('Retry-After', str(api.retry_after))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+
+def start_fake_server(api, host='127.0.0.1', port=0):
+    '''
+    Serve a FakeSteamTwitch from a background thread.
+
+    Returns:
+    --------
+    tuple
+        The server (stop it with shutdown()) and its base URL.
+    '''
+    server = ThreadingHTTPServer((host, port), FakeAPIHandler)
+    server.daemon_threads = True
+    server.api = api
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve a synthetic network through fake Steam and Twitch APIs.")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--rate', type=float, default=None)
+    args = parser.parse_args()
+
+    api = FakeSteamTwitch(generate_network(args.users, args.seed), args.latency, error_rate=args.error_rate,
+                          throttle_rate=args.throttle_rate, rate=args.rate, seed=args.seed)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), FakeAPIHandler)
+    server.daemon_threads = True
+    server.api = api
+    print(f"Serving {args.users} users on http://127.0.0.1:{args.port}, root user {api.user_ids[0]}")
+    server.serve_forever()
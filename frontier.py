@@ -0,0 +1,270 @@
+import base64
+import hashlib
+import heapq
+import math
+import os
+from collections import deque
+
+
+class BloomFilter:
+    '''
+    Fixed-size Bloom filter over strings.
+
+    Attributes:
+    ----------
+    num_bits : int
+        The size of the bit array.
+    num_hashes : int
+        The number of bit positions set per item.
+    '''
+    def __init__(self, capacity, error_rate=0.001):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def to_state(self):
+        return {'num_bits': self.num_bits, 'num_hashes': self.num_hashes,
+                'bits': base64.b64encode(bytes(self.bits)).decode()}
+
+    @classmethod
+    def from_state(cls, state):
+        bloom = cls.__new__(cls)
+        bloom.num_bits = state['num_bits']
+        bloom.num_hashes = state['num_hashes']
+        bloom.bits = bytearray(base64.b64decode(state['bits']))
+        return bloom
+
+
+
+class VisitedSet:
+    '''
+    Set of visited Steam ids with O(1) membership checks.
+
+    Numeric ids are kept as Python ints, which take half the memory of the
+    equivalent strings. With a bloom_capacity the set is fronted by a Bloom
+    filter: ids the filter has never seen skip the exact lookup. With
+    exact=False only the Bloom filter is kept, so memory stays fixed no matter
+    how many users are visited, at the price of wrongly treating about
+    error_rate of the new users as visited.
+
+    With a log_file every added id is also appended to that file, and the
+    state of the set is only the length of the log: checkpoints take
+    constant time, and from_state rebuilds the set by replaying the log.
+    '''
+    def __init__(self, bloom_capacity=None, error_rate=0.001, exact=True, log_file=None):
+        if not exact and bloom_capacity is None:
+            raise ValueError("An inexact visited set needs a bloom_capacity.")
+        self.bloom_capacity = bloom_capacity
+        self.error_rate = error_rate
+        self.bloom = BloomFilter(bloom_capacity, error_rate) if bloom_capacity else None
+        self.ids = set() if exact else None
+        self.count = 0
+        self.log_file = log_file
+        self.pending = []
+        if log_file is not None:
+            os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+            open(log_file, 'w').close()
+
+    @staticmethod
+    def _key(user_id):
+        return int(user_id) if user_id.isdigit() else user_id
+
+    def __contains__(self, user_id):
+        if self.bloom is not None and user_id not in self.bloom:
+            return False
+        return self.ids is None or self._key(user_id) in self.ids
+
+    def add(self, user_id):
+        self._add(user_id)
+        if self.log_file is not None:
+            self.pending.append(user_id)
+
+    def _add(self, user_id):
+        if self.bloom is not None:
+            self.bloom.add(user_id)
+        if self.ids is not None:
+            self.ids.add(self._key(user_id))
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def to_state(self):
+        if self.log_file is not None:
+            with open(self.log_file, 'ab') as file:
+                file.write(''.join(user_id + '\n' for user_id in self.pending).encode())
+            self.pending = []
+            return {'log_file': self.log_file, 'end': os.path.getsize(self.log_file),
+                    'bloom_capacity': self.bloom_capacity, 'error_rate': self.error_rate, 'exact': self.ids is not None}
+        return {'ids': None if self.ids is None else [str(user_id) for user_id in self.ids],
+                'bloom': None if self.bloom is None else self.bloom.to_state(),
+                'count': self.count}
+
+    @classmethod
+    def from_state(cls, state):
+        if 'log_file' in state:
+            visited = cls(state['bloom_capacity'], state['error_rate'], state['exact'])
+            visited.log_file = state['log_file']
+            with open(visited.log_file, 'ab') as file:
+                file.truncate(state['end'])
+            with open(visited.log_file, 'r') as file:
+                for line in file:
+                    visited._add(line[:-1])
+            return visited
+        visited = cls.__new__(cls)
+        visited.bloom = None if state['bloom'] is None else BloomFilter.from_state(state['bloom'])
+        visited.ids = None if state['ids'] is None else {cls._key(user_id) for user_id in state['ids']}
+        visited.count = state['count']
+        visited.bloom_capacity = visited.error_rate = None
+        visited.log_file = None
+        visited.pending = []
+        return visited
+
+
+
+class SpillQueue:
+    '''
+    FIFO queue of string ids backed by an append-only file in spill_dir.
+
+    Appended items are buffered and written to the end of the file once
+    memory_limit of them are pending; items are popped from a read-ahead
+    buffer of at most memory_limit items refilled from the file. The state
+    of the queue (see to_state) is only the file and the offsets of its
+    first unpopped and last written item, so checkpointing it takes
+    constant time however long the queue grows. The file is only removed
+    with the spill directory.
+    '''
+    def __init__(self, spill_dir, memory_limit=100000, name='frontier'):
+        os.makedirs(spill_dir, exist_ok=True)
+        self.path = os.path.join(spill_dir, name + '.txt')
+        self.memory_limit = memory_limit
+        self.head = deque()
+        self.tail = []
+        self.read_offset = 0
+        self.pop_offset = 0
+        self.size = 0
+        open(self.path, 'w').close()
+
+    def append(self, item):
+        self.tail.append(item)
+        self.size += 1
+        if len(self.tail) >= self.memory_limit:
+            self._flush()
+
+    def popleft(self):
+        if not self.head:
+            self._flush()
+            with open(self.path, 'rb') as file:
+                file.seek(self.read_offset)
+                for line in file:
+                    self.head.append(line[:-1].decode())
+                    self.read_offset += len(line)
+                    if len(self.head) >= self.memory_limit:
+                        break
+        item = self.head.popleft()
+        self.pop_offset += len(item.encode()) + 1
+        self.size -= 1
+        return item
+
+    def take(self, n):
+        return [self.popleft() for _ in range(min(n, self.size))]
+
+    def __len__(self):
+        return self.size
+
+    def _flush(self):
+        if self.tail:
+            with open(self.path, 'ab') as file:
+                file.write(''.join(item + '\n' for item in self.tail).encode())
+            self.tail = []
+
+    def to_state(self):
+        self._flush()
+        return {'path': self.path, 'offset': self.pop_offset, 'end': os.path.getsize(self.path), 'size': self.size}
+
+    @classmethod
+    def from_state(cls, state, spill_dir, memory_limit=100000, name='frontier'):
+        queue = cls.__new__(cls)
+        queue.path = state['path']
+        queue.memory_limit = memory_limit
+        queue.head = deque()
+        queue.tail = []
+        queue.read_offset = queue.pop_offset = state['offset']
+        queue.size = state['size']
+        # Items appended after the checkpoint are appended again by the resumed crawl
+        with open(queue.path, 'ab') as file:
+            file.truncate(state['end'])
+        return queue
+
+
+
+class PriorityFrontier:
+    '''
+    Queue of string ids popped by highest priority, whose priorities can be
+    raised while they wait.
+
+    Priorities are raised lazily: every raise pushes a new heap entry and
+    outdated entries are skipped when popped. Ties go to the smaller depth,
+    then to the id queued first, so with constant priorities the frontier
+    pops in breadth-first order.
+    '''
+    def __init__(self):
+        self.heap = []
+        self.entries = {}
+        self.counter = 0
+
+    def push(self, item, priority, depth):
+        '''
+        Queue item, or raise its priority by priority if it is already queued.
+        '''
+        entry = self.entries.get(item)
+        if entry is None:
+            entry = self.entries[item] = [0, depth, self.counter]
+            self.counter += 1
+        entry[0] += priority
+        heapq.heappush(self.heap, (-entry[0], entry[1], entry[2], item))
+
+    def pop(self):
+        '''
+        Remove the item of highest priority and return it with its depth.
+        '''
+        while True:
+            priority, depth, _, item = heapq.heappop(self.heap)
+            entry = self.entries.get(item)
+            if entry is not None and -priority == entry[0]:
+                del self.entries[item]
+                return item, depth
+
+    def take(self, n):
+        return [self.pop() for _ in range(min(n, len(self.entries)))]
+
+    def __contains__(self, item):
+        return item in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def to_state(self):
+        return {'entries': self.entries, 'counter': self.counter}
+
+    @classmethod
+    def from_state(cls, state):
+        frontier = cls()
+        frontier.entries = state['entries']
+        frontier.counter = state['counter']
+        frontier.heap = [(-priority, depth, order, item) for item, (priority, depth, order) in frontier.entries.items()]
+        heapq.heapify(frontier.heap)
+        return frontier
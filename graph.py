@@ -1,36 +1,73 @@
-import numpy as np
-import json
-
-### load cache
-with open("api_cache.json") as f:
-        cache = json.load(f)
+import os
 
-user_friend_graph = cache["user_friend_graph"]
-user_game_mapping = cache["user_game_mapping"]
-game_detail = cache["game_detail"]
+import numpy as np
+from store import APICache
+from vocabulary import GenreVocabulary
+from similarity import SimilarityEngine
+from stream import user_records
+from metrics import metrics
+
+CACHE_FILE = 'api_cache.db'
+
+# Crawled data the functions below default to, filled in place by load_cache
+# so that names imported from this module see it.
+user_friend_graph = {}
+user_game_mapping = {}
 game_name_mapping = {}
 game_interests_mapping = {}
+genre_vocabulary = GenreVocabulary()
 
-for game_id, detail in game_detail.items():
-    # print(game_id)
-    if not detail:
-        continue
-    if "name" not in detail:
-        game_name_mapping[game_id] = []
-    
-    game_name_mapping[game_id] = detail['name']
 
+def load_cache(cache_file=CACHE_FILE):
+    '''
+    Load the crawled data of an APICache into the module-level mappings.
 
-for game_id, detail in game_detail.items():
-    # print(game_id)
-    if not detail:
-        continue
-    if "genres" not in detail:
-        game_interests_mapping[game_id] = []
-        continue
-    
-    genres = [item["description"] for item in detail["genres"]]
-    game_interests_mapping[game_id] = genres
+    Parameters:
+    -----------
+    cache_file : str
+        The path of the SQLite cache written by the crawler.
+
+    Raises:
+    -------
+    FileNotFoundError
+        If there is no cache, rather than letting APICache create an empty one.
+    '''
+    if not os.path.exists(cache_file):
+        raise FileNotFoundError(f"No crawled data in {cache_file}, crawl it with api.py first.")
+    with metrics.stage('cache_load'):
+        cache = APICache(cache_file)
+        game_detail = cache.get("game_detail") or {}
+        user_friend_graph.clear()
+        user_friend_graph.update((cache.get("user_friend_graph") or {}).items())
+        user_game_mapping.clear()
+        user_game_mapping.update((cache.get("user_game_mapping") or {}).items())
+        game_name_mapping.clear()
+        game_interests_mapping.clear()
+
+        for game_id, detail in game_detail.items():
+            # print(game_id)
+            if not detail:
+                continue
+            if "name" not in detail:
+                game_name_mapping[game_id] = []
+
+            game_name_mapping[game_id] = detail['name']
+
+
+        for game_id, detail in game_detail.items():
+            # print(game_id)
+            if not detail:
+                continue
+            if "genres" not in detail:
+                game_interests_mapping[game_id] = []
+                continue
+
+            genres = [item["description"] for item in detail["genres"]]
+            game_interests_mapping[game_id] = genres
+
+        for genres in game_interests_mapping.values():
+            for genre in genres:
+                genre_vocabulary.add(genre)
 
 
 
@@ -69,6 +106,17 @@ class Node:
         '''
         return False
 
+    def owns_games(self):
+        '''
+        Check if any game node is connected to this node.
+
+        Returns:
+        --------
+        bool
+            True if the user owns at least one game.
+        '''
+        return any(friend.is_game_node() for friend in self.friends)
+
     
 
 class GameNode(Node):
@@ -79,14 +127,31 @@ class GameNode(Node):
     ----------
     num_owned : int
         The number of times this game is owned by users within the network.
+    vocabulary : GenreVocabulary
+        The vocabulary the genres of the game are interned in.
+    vector : np.ndarray
+        float32 vector over the vocabulary, holding the mean playtime score
+        of the game's owners at the positions of its genres.
     '''
-    def __init__(self, id):
-        super().__init__(id)
-        self.num_owned = 1
+    def __init__(self, id, vocabulary=None):
+        self.id = id
+        self.friends = []
+        self.num_owned = 0
+        self.mean_score = 0.0
+        self.vocabulary = vocabulary if vocabulary is not None else genre_vocabulary
+        self.vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+
+    @property
+    def interests(self):
+        '''
+        The (genre, score) tuples of the game, one per genre.
+        '''
+        return self.vocabulary.interests(self.vector)
     
     def set_node_interests(self, interests, play_time):
         '''
-        Set the interests for this game node with an adjustment based on play time.
+        Record one more owner of this game, updating the running mean of the
+        owners' playtime scores that is stored for each of its genres.
 
         Parameters:
         -----------
@@ -98,14 +163,9 @@ class GameNode(Node):
         def modified_sigmoid(x):
             return 0.5 * (1 / (1 + np.exp(-0.001*x))) + 0.5
         
-        if len(self.interests) == 0:
-            for interest in interests:
-                self.interests.append((interest, modified_sigmoid(play_time)))
-        else:
-            score_total = self.interests[0][1] * self.num_owned
-            self.num_owned += 1
-            for interest in interests:
-                self.interests.append((interest, (score_total + modified_sigmoid(play_time))/self.num_owned))
+        self.num_owned += 1
+        self.mean_score += (modified_sigmoid(play_time) - self.mean_score) / self.num_owned
+        self.vector[self.vocabulary.indices(interests)] = self.mean_score
     
     def is_game_node(self):
         '''
@@ -120,7 +180,8 @@ class GameNode(Node):
 
 
 
-def build_graph(user_friend_graph, user_game_mapping):
+@metrics.timed('build_graph')
+def build_graph(user_friend_graph, user_game_mapping, game_interests=None):
     '''
     Build a graph based on the user friend relationships and game preferences.
 
@@ -130,6 +191,8 @@ def build_graph(user_friend_graph, user_game_mapping):
         A dictionary representing the user friend relationships.
     user_game_mapping : dict
         A dictionary mapping users to their preferred games.
+    game_interests : dict
+        A dictionary mapping game IDs to their genres, game_interests_mapping by default.
 
     Returns:
     --------
@@ -138,6 +201,10 @@ def build_graph(user_friend_graph, user_game_mapping):
     '''
     node_dict = {}
     game_dict = {}
+    if game_interests is None:
+        vocabulary = genre_vocabulary
+    else:
+        vocabulary = GenreVocabulary.from_game_interests(game_interests)
 
     # Create graph nodes for each user and assign game leaves
     for user in user_friend_graph:
@@ -147,9 +214,13 @@ def build_graph(user_friend_graph, user_game_mapping):
             if g["appid"] in game_dict:
                 game_node = game_dict[g["appid"]]
             else:
-                game_node = GameNode(g["appid"])
+                game_node = GameNode(g["appid"], vocabulary)
                 game_dict[g["appid"]] = game_node
-            game_node.set_node_interests(get_game_interests(str(g["appid"])), g["playtime_forever"])
+            if game_interests is None:
+                interests = get_game_interests(str(g["appid"]))
+            else:
+                interests = game_interests.get(str(g["appid"]), [])
+            game_node.set_node_interests(interests, g["playtime_forever"])
             node_dict[user].add_friend(game_node)
 
     # Connect the user nodes based on the friend relationships
@@ -157,11 +228,99 @@ def build_graph(user_friend_graph, user_game_mapping):
         for friend in friends:
             node_dict[user].add_friend(node_dict[friend])
 
+    record_graph_size(node_dict)
     # Return the root user
     return node_dict
 
 
 
+@metrics.timed('build_graph')
+def build_graph_stream(records):
+    '''
+    Build the same graph as build_graph from the records of a crawl stream,
+    one record at a time.
+
+    Users are added as their records arrive, with placeholder nodes for
+    friends that have not been crawled yet. The playtimes of games whose
+    details are not known yet are kept until their app record arrives, so
+    the records can be consumed while the crawl is still running, e.g. from
+    read_records(stream_file, follow=True). Friends that never got a record
+    of their own are dropped once the stream ends, as build_graph only keeps
+    crawled users.
+
+    Parameters:
+    -----------
+    records : iterable
+        The records of a crawl stream (see stream.py).
+
+    Returns:
+    --------
+    dict
+        A graph represented as a dictionary mapping user IDs to their corresponding Node instances.
+    '''
+    node_dict = {}
+    crawled = {}
+    game_dict = {}
+    game_interests = {}
+    pending = {}
+    vocabulary = GenreVocabulary()
+
+    def add_owner(game_node, interests, play_time):
+        if len(game_node.vector) < len(vocabulary):
+            game_node.vector = np.pad(game_node.vector, (0, len(vocabulary) - len(game_node.vector)))
+        game_node.set_node_interests(interests, play_time)
+
+    for record in user_records(records):
+        if record["type"] == "user":
+            user = record["steamid"]
+            node = node_dict.setdefault(user, Node(user))
+            crawled[user] = node
+            for g in record["games"]:
+                game_id = str(g["appid"])
+                if game_id not in game_dict:
+                    game_dict[game_id] = GameNode(g["appid"], vocabulary)
+                if game_id in game_interests:
+                    add_owner(game_dict[game_id], game_interests[game_id], g["playtime_forever"])
+                else:
+                    pending.setdefault(game_id, []).append(g["playtime_forever"])
+                node.add_friend(game_dict[game_id])
+            for friend in record["friends"]:
+                node.add_friend(node_dict.setdefault(friend, Node(friend)))
+
+        elif record["type"] == "app":
+            game_id = str(record["appid"])
+            detail = record["detail"] or {}
+            game_interests[game_id] = [item["description"] for item in detail.get("genres", [])]
+            for genre in game_interests[game_id]:
+                vocabulary.add(genre)
+            for play_time in pending.pop(game_id, []):
+                add_owner(game_dict[game_id], game_interests[game_id], play_time)
+
+    for game_id, play_times in pending.items():
+        for play_time in play_times:
+            add_owner(game_dict[game_id], [], play_time)
+    for game_node in game_dict.values():
+        game_node.vector = np.pad(game_node.vector, (0, len(vocabulary) - len(game_node.vector)))
+    for node in crawled.values():
+        node.friends = [friend for friend in node.friends if friend.is_game_node() or friend.id in crawled]
+    record_graph_size(crawled)
+    return crawled
+
+
+
+def record_graph_size(node_dict):
+    '''
+    Report the number of user nodes, game nodes and edges of a graph to the metrics registry.
+    '''
+    if not metrics.enabled:
+        return
+    games = {id(friend) for node in node_dict.values() for friend in node.friends if friend.is_game_node()}
+    metrics.set_gauge('graph_nodes', len(node_dict), kind='user')
+    metrics.set_gauge('graph_nodes', len(games), kind='game')
+    metrics.set_gauge('graph_edges', sum(len(node.friends) for node in node_dict.values()))
+
+
+
 def propagate_interests(node, visited=None):
     '''
     Propagate interests from the given node to its friends.
@@ -172,7 +331,8 @@ def propagate_interests(node, visited=None):
         The node whose interests will be propagated.
     '''
     if visited is None:
-        visited = set()
+        with metrics.stage('propagate_interests'):
+            return propagate_interests(node, set())
 
     # Base case: If the node is a game leaf, return its interests
     if not node.friends:
@@ -247,16 +407,17 @@ def perform_aggregation(nodes):
             user_nodes.append(node)
     
     user_interests_tuple = [user_interest_tuple for user_node in user_nodes for user_interest_tuple in user_node.interests]
-    game_interests_tuple = [game_interest_tuple for game_node in game_nodes for game_interest_tuple in game_node.interests]
     
     dic = {}
 
-    for game_interest_tuple in game_interests_tuple:
-        if game_interest_tuple[0] not in dic:
-            dic[game_interest_tuple[0]] = [game_interest_tuple[1], 1]
-            continue
-        dic[game_interest_tuple[0]][0] += game_interest_tuple[1]
-        dic[game_interest_tuple[0]][1] += 1
+    # Game interests are fixed-length vectors over the genre vocabulary, summed in one go
+    if game_nodes:
+        genres = game_nodes[0].vocabulary.genres
+        vectors = np.stack([game_node.vector for game_node in game_nodes])
+        totals = vectors.sum(axis=0, dtype=np.float64)
+        counts = (vectors > 0).sum(axis=0)
+        for i in np.flatnonzero(counts):
+            dic[genres[i]] = [totals[i], counts[i]]
 
     for user_interest_tuple in user_interests_tuple:
         if user_interest_tuple[0] not in dic:
@@ -272,34 +433,37 @@ def perform_aggregation(nodes):
 
 
 
-def recommend_users(graph, root_user, num_recommendations=5):
+@metrics.timed('similarity')
+def recommend_users(graph, root_user, num_recommendations=5, engine=None):
     '''
     Recommend a list of users to the given user based on their interests.
 
+    The cosine similarity to every user that owns games is computed with one
+    matrix-vector product over the normalized interest vectors, and the best
+    users are picked with a partial selection (see SimilarityEngine).
+    Normalizing the vectors touches every user, so callers making several
+    queries should build the engine once, after propagating the interests,
+    and pass it in.
+
     Parameters:
     -----------
     graph : dict
-        A graph represented as a dictionary mapping user IDs to their corresponding Node instances.
+        A graph represented as a dictionary mapping user IDs to their corresponding Node instances,
+        or an ArrayGraph.
     root_user : str
         The ID of the user to whom recommendations will be made.
     num_recommendations : int
+    engine : SimilarityEngine
+        The engine over the users of graph, SimilarityEngine.from_graph(graph) by default.
 
     Returns:
     --------
     list
         A list of tupples containing the user ID and similarity score.
     '''
-    root_interests = graph[root_user].interests
-
-    # Collect similar users based on interests and scores
-    similar_users = []
-    for user, node in graph.items():
-        if (user != root_user) and (len(user_game_mapping[user]) != 0):
-            similarity = calculate_similarity(root_interests, node.interests)
-            similar_users.append((user, similarity))
-
-    similar_users = sorted(similar_users, key=lambda x: x[1], reverse=True)
-    return similar_users[:num_recommendations]
+    if engine is None:
+        engine = SimilarityEngine.from_graph(graph)
+    return engine.recommend(root_user, num_recommendations)
 
 
 def calculate_similarity(interests1, interests2):
@@ -326,7 +490,7 @@ def calculate_similarity(interests1, interests2):
     return similarity
 
 
-def recommend_games(user, recommend_num=3):
+def recommend_games(user, recommend_num=3, game_mapping=None):
     '''
     Recommends games for a specific user based on playtime.
 
@@ -339,13 +503,18 @@ def recommend_games(user, recommend_num=3):
         The user ID for whom recommendations will be made.
     recommend_num : int
         The number of games to recommend.
+    game_mapping : dict
+        The user to games mapping to use, user_game_mapping by default
+        (pass ArrayGraph.user_game_mapping for an array-backed graph).
         
     Returns:
     --------
     list
         A list of tupples containing the game ID and playtime.
     '''
-    user_games = user_game_mapping[str(user)]
+    if game_mapping is None:
+        game_mapping = user_game_mapping
+    user_games = game_mapping[str(user)]
     user_games = sorted(user_games, key=lambda x: x["playtime_forever"], reverse=True)
     return user_games[:recommend_num]
 
@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from model import RecommendationModel
+from parallel import similar_users_parallel
+from similarity import top_k
+from snapshot import publish_directory, read_published
+
+MATERIALIZED_VERSION = 1
+
+ARRAYS = [
+    'user_ids', 'user_sorted_ids', 'user_sort_index', 'game_ids',
+    'similar_users', 'similar_scores', 'games', 'game_scores', 'genres', 'genre_scores',
+]
+
+
+def materialize(model, output_dir='recommendations', k=5, processes=None):
+    '''
+    Precompute the k similar users, games and genres of every user of a
+    RecommendationModel and write them to output_dir.
+
+    The neighbours of all users are found once, in parallel (see
+    similar_users_parallel), with as many columns as the game recommender
+    needs; their first k columns are the similar users and all of them feed
+    the collaborative-filtering games. The result is one fixed-width row per
+    user in each array, plus the sorted Steam ids to find a user's row, so
+    MaterializedRecommendations answers any user with one lookup. Like a
+    snapshot, the new directory is written next to the old one and published
+    with publish_directory, which is not atomic; readers go through
+    read_published.
+
+    Parameters:
+    -----------
+    model : RecommendationModel
+        The model to materialize.
+    output_dir : str
+        The directory to write.
+    k : int
+        The number of recommendations of each kind per user.
+    processes : int
+        The number of processes of the neighbour search, os.cpu_count() by default.
+
+    Returns:
+    --------
+    dict
+        The number of users, the build time in seconds and the size in bytes of the output.
+    '''
+    start = time.perf_counter()
+    snapshot = model.graph.snapshot
+    best, similarity = similar_users_parallel(model.engine, max(k, model.games.neighbours), processes)
+    games, game_scores = model.games.recommend_all(k, neighbours=(best, similarity))
+
+    best, similarity = best[:, :k], similarity[:, :k]
+    interests = model.graph.user_interests
+    genres = top_k(interests, k)
+    genre_scores = np.take_along_axis(interests, genres, axis=-1)
+    arrays = {
+        'user_ids': snapshot.user_ids,
+        'user_sorted_ids': snapshot.user_sorted_ids,
+        'user_sort_index': snapshot.user_sort_index,
+        'game_ids': snapshot.game_ids,
+        'similar_users': np.where(similarity > -np.inf, best, -1).astype(np.int32),
+        'similar_scores': np.where(similarity > -np.inf, similarity, 0.0).astype(np.float32),
+        'games': games,
+        'game_scores': game_scores,
+        'genres': np.where(genre_scores > 0, genres, -1).astype(np.int16),
+        'genre_scores': genre_scores.astype(np.float32),
+    }
+
+    tmp_dir = output_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name in ARRAYS:
+        np.save(os.path.join(tmp_dir, name + '.npy'), arrays[name])
+    build_seconds = time.perf_counter() - start
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as file:
+        json.dump({'version': MATERIALIZED_VERSION, 'k': k, 'genres': snapshot.genres, 'game_names': snapshot.game_names,
+                   'built_at': time.time(), 'build_seconds': build_seconds}, file)
+    size = sum(os.path.getsize(os.path.join(tmp_dir, name)) for name in os.listdir(tmp_dir))
+    publish_directory(tmp_dir, output_dir)
+    return {'users': snapshot.num_users, 'build_seconds': build_seconds, 'bytes': size}
+
+
+
+class MaterializedRecommendations:
+    '''
+    Read side of materialize: the precomputed recommendations of every
+    user, memory-mapped from the output directory.
+
+    Looking up a user is one binary search over the sorted Steam ids
+    followed by reading its row of each array, so opening the directory is
+    instant and serving a user does not depend on the size of the network.
+
+    Attributes:
+    ----------
+    k : int
+        The number of recommendations of each kind per user.
+    genre_names : list
+        The genre vocabulary.
+    game_names : list
+        The name of every game, None if Steam had no details.
+    '''
+    def __init__(self, directory='recommendations'):
+        meta, arrays = read_published(directory, self._read)
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.k = meta['k']
+        self.genre_names = meta['genres']
+        self.game_names = meta['game_names']
+        self.built_at = meta['built_at']
+
+    @staticmethod
+    def _read(directory):
+        with open(os.path.join(directory, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+        if meta['version'] != MATERIALIZED_VERSION:
+            raise ValueError(f"Unsupported recommendations version {meta['version']}, materialize them again.")
+        return meta, {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in ARRAYS}
+
+    def row(self, user_id):
+        '''
+        Return the row of a Steam id, or None if the user was not materialized.
+        '''
+        user_id = int(user_id)
+        pos = np.searchsorted(self.user_sorted_ids, user_id)
+        if pos < len(self.user_sorted_ids) and self.user_sorted_ids[pos] == user_id:
+            return int(self.user_sort_index[pos])
+        return None
+
+    def __contains__(self, user_id):
+        return str(user_id).isdigit() and self.row(user_id) is not None
+
+    def recommend(self, user_id, k=None):
+        '''
+        Return the precomputed similar users, games and genres of user_id, in
+        the format of RecommendationModel.recommend.
+
+        Parameters:
+        -----------
+        user_id : str
+            The Steam id of a materialized user.
+        k : int
+            The number of recommendations of each kind, at most (and by default) the materialized k.
+
+        Returns:
+        --------
+        dict
+            The "users", "games" and "genres" recommended to the user, or None for an unknown user.
+        '''
+        row = self.row(user_id) if str(user_id).isdigit() else None
+        if row is None:
+            return None
+        k = self.k if k is None else min(k, self.k)
+        users = [(str(self.user_ids[user]), float(score))
+                 for user, score in zip(self.similar_users[row, :k].tolist(), self.similar_scores[row, :k].tolist())
+                 if user >= 0]
+        games = [{"appid": int(self.game_ids[game]), "name": self.game_names[game], "score": score}
+                 for game, score in zip(self.games[row, :k].tolist(), self.game_scores[row, :k].tolist()) if game >= 0]
+        genres = [(self.genre_names[genre], score)
+                  for genre, score in zip(self.genres[row, :k].tolist(), self.genre_scores[row, :k].tolist()) if genre >= 0]
+        return {"users": users, "games": games, "genres": genres}
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precompute the recommendations of every user of a graph snapshot.")
+    parser.add_argument('--snapshot', default='graph_snapshot')
+    parser.add_argument('--output', default='recommendations')
+    parser.add_argument('-k', type=int, default=5)
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    model = RecommendationModel.from_snapshot(args.snapshot)
+    model_seconds = time.perf_counter() - start
+    report = materialize(model, args.output, args.k, args.processes)
+    print(f"Materialized {report['users']} users into {args.output} in {model_seconds + report['build_seconds']:.2f}s "
+          f"({model_seconds:.2f}s model, {report['build_seconds']:.2f}s recommendations), "
+          f"{report['bytes'] / 2 ** 20:.2f} MB.")
@@ -0,0 +1,192 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class Metrics:
+    '''
+    Process-wide registry of pipeline metrics.
+
+    Stages are timed with the stage() context manager, and the rest of the
+    pipeline reports counters (increment), gauges (set_gauge) and latencies
+    (observe), each optionally labelled, e.g. by endpoint or cache section.
+    A disabled registry is the default: every call then returns right after
+    checking the enabled flag, so instrumented code pays one attribute
+    lookup per call.
+
+    The metrics can be exported as JSON or in the Prometheus text
+    exposition format; peak RSS is added at export time.
+
+    Attributes:
+    ----------
+    enabled : bool
+        Whether metrics are recorded.
+    '''
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.summaries = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def increment(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, seconds, **labels):
+        '''
+        Record one duration in the summary (count, sum, max) of name and labels.
+        '''
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            summary = self.summaries.setdefault(key, [0, 0.0, 0.0])
+            summary[0] += 1
+            summary[1] += seconds
+            summary[2] = max(summary[2], seconds)
+
+    def stage(self, name):
+        '''
+        Time a pipeline stage: "with metrics.stage('build_graph'): ...".
+        '''
+        if not self.enabled:
+            return nullcontext()
+        return self._stage(name)
+
+    def timed(self, name):
+        '''
+        Decorator timing every call of a function as the stage name.
+        '''
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self._stage(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def _stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_duration_seconds', time.perf_counter() - start, stage=name)
+
+    def to_dict(self):
+        '''
+        Return all metrics as plain values: counters and gauges by name and
+        labels, summaries with their count, sum and max.
+        '''
+        def labelled(key):
+            name, labels = key
+            return {'name': name, 'labels': dict(labels)}
+
+        with self.lock:
+            counters = [dict(labelled(key), value=value) for key, value in self.counters.items()]
+            gauges = [dict(labelled(key), value=value) for key, value in self.gauges.items()]
+            summaries = [dict(labelled(key), count=count, sum=total, max=peak)
+                         for key, (count, total, peak) in self.summaries.items()]
+        peak = peak_rss()
+        if peak is not None:
+            gauges.append({'name': 'peak_rss_bytes', 'labels': {}, 'value': peak})
+        return {'counters': counters, 'gauges': gauges, 'summaries': summaries}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=4)
+
+    def to_prometheus(self, prefix='game_rec_'):
+        '''
+        Return all metrics in the Prometheus text exposition format.
+        '''
+        data = self.to_dict()
+        lines = []
+        typed = set()
+
+        def sample(family, kind, name, labels, value):
+            if family not in typed:
+                typed.add(family)
+                lines.append(f"# TYPE {family} {kind}")
+            label_text = ','.join(f'{key}="{escape(value)}"' for key, value in sorted(labels.items()))
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        for kind, samples in (('counter', data['counters']), ('gauge', data['gauges'])):
+            for metric in sorted(samples, key=lambda metric: metric['name']):
+                name = prefix + metric['name']
+                sample(name, kind, name, metric['labels'], metric['value'])
+        for metric in sorted(data['summaries'], key=lambda metric: metric['name']):
+            name = prefix + metric['name']
+            sample(name, 'summary', name + '_sum', metric['labels'], metric['sum'])
+            sample(name, 'summary', name + '_count', metric['labels'], metric['count'])
+        for metric in sorted(data['summaries'], key=lambda metric: metric['name']):
+            name = prefix + metric['name'] + '_max'
+            sample(name, 'gauge', name, metric['labels'], metric['max'])
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        '''
+        Write the metrics to path, in the Prometheus format if it ends with .prom and as JSON otherwise.
+        '''
+        with open(path, 'w') as file:
+            file.write(self.to_prometheus() if path.endswith('.prom') else self.to_json())
+
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+
+def peak_rss():
+    '''
+    Return the peak resident set size of the process in bytes.
+
+    The resource module only exists on Unix; elsewhere psutil is used if it
+    is installed (the peak working set on Windows, else the current RSS),
+    and None is returned if it is not.
+    '''
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+
+metrics = Metrics()
+
+# Setting GAME_REC_METRICS to a file path turns metrics on for the whole
+# run and writes them to that file (.prom for Prometheus text) at exit.
+if os.environ.get('GAME_REC_METRICS'):
+    metrics.enable()
+    atexit.register(metrics.dump, os.environ['GAME_REC_METRICS'])
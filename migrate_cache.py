@@ -0,0 +1,12 @@
+from api import project_detail
+from store import migrate_json_cache
+
+c = migrate_json_cache("api_cache.json", "api_cache.db")
+
+# Keep only the app detail fields the graph needs, stored compressed
+game_detail = c.get('game_detail')
+if game_detail is not None:
+    c.set('game_detail', {game_id: project_detail(detail) for game_id, detail in game_detail.items()})
+    c.save_cache()
+    c.vacuum()
+print(f"Migrated sections: {', '.join(c.section_names())}")
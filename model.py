@@ -0,0 +1,122 @@
+import numpy as np
+
+from array_graph import ArrayGraph
+from collaborative import GameRecommender
+from propagation import propagate_interests_all
+from similarity import SimilarityEngine, top_k
+from snapshot import load_snapshot
+
+
+class RecommendationModel:
+    '''
+    Warm, in-memory recommendation model for every user of the network.
+
+    The model propagates interests for all users at once (see
+    propagate_interests_all) and keeps a SimilarityEngine over the result,
+    so similar users, games and genres can be served for any user without
+    rebuilding or re-propagating the graph.
+
+    Attributes:
+    ----------
+    graph : ArrayGraph
+        The graph holding the propagated interests.
+    engine : SimilarityEngine
+        The similarity engine over the interests of all users.
+    games : GameRecommender
+        The collaborative-filtering game recommender.
+    '''
+    def __init__(self, graph, rounds=2, user_weight=0.8, neighbours=20):
+        self.graph = graph
+        self.rounds = rounds
+        self.user_weight = user_weight
+        propagate_interests_all(graph, rounds, user_weight)
+        self.engine = SimilarityEngine.from_graph(graph)
+        self.games = GameRecommender(graph.snapshot, self.engine, neighbours)
+
+    @classmethod
+    def from_snapshot(cls, snapshot_dir='graph_snapshot', **kwargs):
+        return cls(ArrayGraph(load_snapshot(snapshot_dir)), **kwargs)
+
+    @classmethod
+    def from_cache(cls, cache, **kwargs):
+        return cls(ArrayGraph.from_mappings(cache.get("user_friend_graph"), cache.get("user_game_mapping"),
+                                            cache.get("game_detail")), **kwargs)
+
+    def __contains__(self, user_id):
+        return str(user_id) in self.engine.index
+
+    def recommend_users(self, user_id, k=5):
+        '''
+        Return the k users most similar to user_id as (user ID, similarity) tuples.
+        '''
+        return self.engine.recommend(user_id, k)
+
+    def recommend_games(self, user_id, k=5):
+        '''
+        Return the k unowned games that the users most similar to user_id
+        play the most (see GameRecommender).
+        '''
+        games, scores = self.games.recommend_many([self.graph.index(user_id)], k)
+        return self._games(games[0], scores[0])
+
+    def _games(self, games, scores):
+        snapshot = self.graph.snapshot
+        return [{"appid": int(snapshot.game_ids[game]), "name": snapshot.game_names[game], "score": float(score)}
+                for game, score in zip(games, scores) if game >= 0]
+
+    def recommend_genres(self, user_id, k=5):
+        '''
+        Return the k genres with the highest interest score of user_id as (genre, score) tuples.
+        '''
+        scores = self.graph.user_interests[self.graph.index(user_id)]
+        return [(self.graph.vocabulary.genres[i], float(scores[i])) for i in top_k(scores, k) if scores[i] > 0]
+
+    def recommend(self, user_id, k=5):
+        '''
+        Return the similar users, games and genres recommended to user_id.
+
+        Parameters:
+        -----------
+        user_id : str
+            The Steam id of any user of the network.
+        k : int
+            The number of recommendations of each kind.
+
+        Returns:
+        --------
+        dict
+            The "users", "games" and "genres" recommended to the user.
+        '''
+        users = self.recommend_users(user_id, k)
+        return {
+            "users": users,
+            "games": self.recommend_games(user_id, k),
+            "genres": self.recommend_genres(user_id, k),
+        }
+
+    def recommend_many(self, user_ids, k=5):
+        '''
+        Return recommend(user_id, k) for many users.
+
+        The users are processed in batches of GameRecommender.batch_size.
+        The neighbours of each batch are searched once, and they give both
+        its similar users (their first k columns) and its game scores.
+        '''
+        results = {}
+        user_ids = [str(user_id) for user_id in user_ids]
+        batch_size = self.games.batch_size
+        num_neighbours = max(k, self.games.neighbours)
+        for start in range(0, len(user_ids), batch_size):
+            batch_ids = user_ids[start:start + batch_size]
+            rows = [self.graph.index(user_id) for user_id in batch_ids]
+            best, similarity = self.engine.neighbours(rows, num_neighbours)
+            games, scores = self.games.score(rows, best[:, :self.games.neighbours],
+                                             similarity[:, :self.games.neighbours], k)
+            for i, user_id in enumerate(batch_ids):
+                results[user_id] = {
+                    "users": [(self.engine.user_ids[user], float(score))
+                              for user, score in zip(best[i, :k], similarity[i, :k]) if score != -np.inf],
+                    "games": self._games(games[i], scores[i]),
+                    "genres": self.recommend_genres(user_id, k),
+                }
+        return results
@@ -0,0 +1,273 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from array_graph import segment_sum
+from metrics import metrics
+from similarity import top_k
+
+# Chunks are cut at a fixed size, independent of the number of processes,
+# so the result does not depend on how many workers run them.
+CHUNK_SIZE = 4096
+
+
+class SharedArrays:
+    '''
+    NumPy arrays placed in named shared-memory blocks.
+
+    Worker processes attach to the blocks by name (see attach), so arrays
+    are shared without being pickled or copied. Use as a context manager;
+    the blocks are released on exit.
+
+    Attributes:
+    ----------
+    arrays : dict
+        The shared arrays by name, backed by the shared memory.
+    specs : dict
+        The (block name, shape, dtype) of every array, all a worker needs to attach.
+    '''
+    def __init__(self, arrays):
+        self.blocks = []
+        self.arrays = {}
+        self.specs = {}
+        for name, array in arrays.items():
+            self.add(name, array)
+
+    def add(self, name, array):
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        shared[...] = array
+        self.blocks.append(block)
+        self.arrays[name] = shared
+        self.specs[name] = (block.name, array.shape, array.dtype.str)
+        return shared
+
+    def close(self):
+        self.arrays = {}
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+
+_worker_blocks = []
+_worker_arrays = {}
+
+
+def attach(specs):
+    '''
+    Attach to the shared arrays described by specs, returning them by name.
+    '''
+    arrays = {}
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _worker_blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return arrays
+
+
+
+def _init_worker(specs):
+    _worker_arrays.update(attach(specs))
+
+
+
+def user_order(snapshot):
+    '''
+    Order the users by connected component and, within a component, by
+    breadth-first level, so that consecutive users share most of their
+    friends and chunks of the order touch few other chunks.
+
+    Returns:
+    --------
+    np.ndarray
+        A permutation of the user indices.
+    '''
+    indptr = np.asarray(snapshot.friend_indptr)
+    indices = np.asarray(snapshot.friend_indices)
+    num_users = snapshot.num_users
+    seen = np.zeros(num_users, dtype=bool)
+    order = []
+    isolated = np.flatnonzero(indptr[1:] == indptr[:-1])
+    seen[isolated] = True
+    for seed in range(num_users):
+        if seen[seed]:
+            continue
+        seen[seed] = True
+        frontier = np.array([seed])
+        while len(frontier):
+            order.append(frontier)
+            starts, ends = indptr[frontier], indptr[frontier + 1]
+            lengths = ends - starts
+            positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+            neighbours = indices[positions]
+            neighbours = neighbours[~seen[neighbours]]
+            neighbours = neighbours[np.sort(np.unique(neighbours, return_index=True)[1])]
+            seen[neighbours] = True
+            frontier = neighbours
+    order.append(isolated)
+    return np.concatenate(order).astype(np.int64)
+
+
+
+def _chunks(num_rows, chunk_size):
+    return [(start, min(start + chunk_size, num_rows)) for start in range(0, num_rows, chunk_size)]
+
+
+
+@contextmanager
+def worker_pool(specs, processes=None):
+    '''
+    Yield a map(function, tasks) that runs function(*task) for every task in
+    a pool of processes attached to the shared arrays, or in this process if
+    processes is 0. The pool is kept for every map until the block exits.
+    '''
+    if processes is None:
+        processes = os.cpu_count()
+    if processes == 0:
+        _worker_arrays.update(attach(specs))
+        try:
+            yield lambda function, tasks: [function(*task) for task in tasks]
+        finally:
+            _worker_arrays.clear()
+            while _worker_blocks:
+                _worker_blocks.pop().close()
+        return
+
+    # Workers get one BLAS thread each, the pool provides the parallelism.
+    # The pool starts its processes on demand, so keep the setting until it exits.
+    saved = {name: os.environ.get(name) for name in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')}
+    os.environ.update({name: '1' for name in saved})
+    try:
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(specs,)) as pool:
+            yield lambda function, tasks: list(pool.map(function, *zip(*tasks)))
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+
+
+
+def _aggregate_chunk(source, target, start, end, user_weight):
+    arrays = _worker_arrays
+    users = arrays['order'][start:end]
+    indptr = arrays['friend_indptr']
+    starts = indptr[users]
+    lengths = indptr[users + 1] - starts
+    positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+    friend_interests = arrays[source][arrays['friend_indices'][positions]]
+    chunk_indptr = np.concatenate([[0], np.cumsum(lengths)])
+
+    total = arrays['game_sum'][users] + user_weight * segment_sum(friend_interests, chunk_indptr)
+    count = arrays['game_cnt'][users] + segment_sum(friend_interests > 0, chunk_indptr)
+    arrays[target][users] = np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+
+
+
+@metrics.timed('propagate_interests_parallel')
+def propagate_interests_parallel(graph, rounds=2, user_weight=0.8, processes=None, chunk_size=CHUNK_SIZE):
+    '''
+    Run propagate_interests_all over a pool of processes.
+
+    The adjacency, the game totals and two interest buffers are placed in
+    shared memory. Users are ordered by connected component and
+    breadth-first level (see user_order) and cut into fixed-size chunks;
+    every round, the workers aggregate their chunks from the previous
+    round's buffer into the other one. Every user is computed with exactly
+    the operations of propagate_interests_all, so the result is identical to
+    it whatever the number of processes.
+
+    Parameters:
+    -----------
+    graph : ArrayGraph
+        The graph whose user_interests are filled in.
+    rounds : int
+        The number of friend hops that contribute to a profile.
+    user_weight : float
+        The weight of interests propagated from other users.
+    processes : int
+        The number of worker processes, os.cpu_count() by default, 0 to run
+        the chunks in this process.
+    chunk_size : int
+        The number of users per task.
+
+    Returns:
+    --------
+    np.ndarray
+        The users x genres interest matrix of the graph.
+    '''
+    from propagation import game_interest_totals
+
+    snapshot = graph.snapshot
+    game_sum, game_cnt = game_interest_totals(graph)
+    initial = np.divide(game_sum, game_cnt, out=np.zeros_like(game_sum), where=game_cnt > 0)
+    order = user_order(snapshot)
+
+    with SharedArrays({'order': order, 'friend_indptr': snapshot.friend_indptr,
+                       'friend_indices': snapshot.friend_indices, 'game_sum': game_sum, 'game_cnt': game_cnt,
+                       'interests_0': initial, 'interests_1': np.zeros_like(initial)}) as shared:
+        with worker_pool(shared.specs, processes) as run:
+            for t in range(rounds):
+                source, target = f'interests_{t % 2}', f'interests_{(t + 1) % 2}'
+                run(_aggregate_chunk, [(source, target, start, end, user_weight)
+                                       for start, end in _chunks(len(order), chunk_size)])
+        graph.user_interests[:] = shared.arrays[f'interests_{rounds % 2}']
+    return graph.user_interests
+
+
+
+def _neighbour_chunk(start, end, k):
+    arrays = _worker_arrays
+    vectors = arrays['vectors']
+    rows = np.arange(start, end)
+    scores = vectors[start:end] @ vectors.T
+    scores[:, ~arrays['eligible']] = -np.inf
+    scores[np.arange(len(rows)), rows] = -np.inf
+    best = top_k(scores, k)
+    arrays['best'][start:end] = best
+    arrays['scores'][start:end] = np.take_along_axis(scores, best, axis=-1)
+
+
+
+@metrics.timed('similarity_parallel')
+def similar_users_parallel(engine, k=5, processes=None, chunk_size=CHUNK_SIZE):
+    '''
+    Find the k most similar users of every user of a SimilarityEngine over a pool of processes.
+
+    The normalized vectors are shared with the workers, which score
+    fixed-size chunks of users against everyone and write their top k into
+    shared result arrays. Every chunk allocates a dense chunk x users score
+    matrix, so chunks are cut smaller than chunk_size when needed to keep
+    it around 128 MB per worker, like GameRecommender.recommend_all. The
+    size depends only on the number of users, never on processes.
+
+    Returns:
+    --------
+    tuple
+        The users x k matrix of neighbour indices and the matrix of their
+        similarities, as returned by SimilarityEngine.neighbours for all users.
+    '''
+    num_users = len(engine.user_ids)
+    k = min(k, num_users)
+    chunk_size = max(1, min(chunk_size, (1 << 24) // max(num_users, 1)))
+    with SharedArrays({'vectors': engine.vectors, 'eligible': engine.eligible,
+                       'best': np.zeros((num_users, k), dtype=np.int64),
+                       'scores': np.zeros((num_users, k))}) as shared:
+        with worker_pool(shared.specs, processes) as run:
+            run(_neighbour_chunk, [(start, end, k) for start, end in _chunks(num_users, chunk_size)])
+        return shared.arrays['best'].copy(), shared.arrays['scores'].copy()
@@ -0,0 +1,153 @@
+import numpy as np
+
+from array_graph import ArrayGraph, segment_sum
+from metrics import metrics
+
+
+def game_interest_totals(graph):
+    '''
+    Sum the game interest vectors of every user.
+
+    Returns:
+    --------
+    tuple
+        Two users x genres matrices: the summed vectors of the games each
+        user owns, and the number of those games that have each genre.
+    '''
+    snapshot = graph.snapshot
+    vectors = graph.game_vectors[np.asarray(snapshot.own_indices)]
+    return (segment_sum(vectors, snapshot.own_indptr),
+            segment_sum(vectors > 0, snapshot.own_indptr))
+
+
+
+def propagation_tree(snapshot, root):
+    '''
+    Reproduce the traversal of the recursive propagate_interests without recursion.
+
+    propagate_interests walks the graph depth-first from the root, and every
+    user aggregates the interests of the friends it is the first to reach.
+    This walk is done with an explicit stack, so it is not bounded by
+    Python's recursion limit. Users without friends and games contribute
+    nothing and are left out of the tree.
+
+    Returns:
+    --------
+    tuple
+        The parent of every user (-1 for the root and users outside the tree)
+        and its depth in the tree (-1 outside the tree).
+    '''
+    indptr = snapshot.friend_indptr.tolist()
+    indices = snapshot.friend_indices.tolist()
+    degree = np.diff(snapshot.friend_indptr) + np.diff(snapshot.own_indptr)
+    parent = np.full(snapshot.num_users, -1, dtype=np.int64)
+    depth = np.full(snapshot.num_users, -1, dtype=np.int64)
+    if degree[root] == 0:
+        return parent, depth
+
+    active = degree > 0
+    depth[root] = 0
+    stack = [(root, indptr[root])]
+    while stack:
+        user, pos = stack[-1]
+        end = indptr[user + 1]
+        while pos < end and (depth[indices[pos]] >= 0 or not active[indices[pos]]):
+            pos += 1
+        if pos == end:
+            stack.pop()
+            continue
+        child = indices[pos]
+        stack[-1] = (user, pos + 1)
+        parent[child] = user
+        depth[child] = depth[user] + 1
+        stack.append((child, indptr[child]))
+    return parent, depth
+
+
+
+@metrics.timed('propagate_interests_matrix')
+def propagate_interests_matrix(graph, root_user, user_weight=0.8):
+    '''
+    Propagate interests over an ArrayGraph the way propagate_interests does,
+    with one vectorized aggregation per tree level instead of one
+    perform_aggregation call per user.
+
+    For every genre, a user's score is the sum of the interest vectors of its
+    games plus user_weight times the scores of its children in the
+    traversal tree, divided by the number of those games and scores. The
+    levels of the tree are aggregated deepest first, so children are always
+    done before their parent.
+
+    Parameters:
+    -----------
+    graph : ArrayGraph
+        The graph whose user_interests are filled in.
+    root_user : str
+        The ID of the user the propagation starts from.
+    user_weight : float
+        The weight of interests propagated from other users.
+
+    Returns:
+    --------
+    np.ndarray
+        The users x genres interest matrix of the graph.
+    '''
+    snapshot = graph.snapshot
+    root = graph.index(root_user)
+    parent, depth = propagation_tree(snapshot, root)
+    game_sum, game_cnt = game_interest_totals(graph)
+
+    child_sum = np.zeros_like(game_sum)
+    child_cnt = np.zeros_like(game_cnt)
+    interests = graph.user_interests
+    for level in range(depth.max(), -1, -1):
+        users = np.flatnonzero(depth == level)
+        total = game_sum[users] + user_weight * child_sum[users]
+        count = game_cnt[users] + child_cnt[users]
+        interests[users] = np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+        if level > 0:
+            np.add.at(child_sum, parent[users], interests[users])
+            np.add.at(child_cnt, parent[users], interests[users] > 0)
+    return interests
+
+
+
+@metrics.timed('propagate_interests_all')
+def propagate_interests_all(graph, rounds=2, user_weight=0.8):
+    '''
+    Compute an interest profile for every user of an ArrayGraph in one pass,
+    independently of any root user.
+
+    Every user starts from the aggregation of its own games. Each round then
+    re-aggregates every user from its games and the current profiles of all
+    its friends, with the weighting and averaging of perform_aggregation, as
+    one sparse product over the friend adjacency. After r rounds a profile
+    reflects the user's r-hop neighbourhood, like a propagation from that
+    user over a crawl of depth r, and the result does not depend on the
+    order in which users are visited.
+
+    Parameters:
+    -----------
+    graph : ArrayGraph
+        The graph whose user_interests are filled in.
+    rounds : int
+        The number of friend hops that contribute to a profile.
+    user_weight : float
+        The weight of interests propagated from other users.
+
+    Returns:
+    --------
+    np.ndarray
+        The users x genres interest matrix of the graph.
+    '''
+    snapshot = graph.snapshot
+    game_sum, game_cnt = game_interest_totals(graph)
+    friends = np.asarray(snapshot.friend_indices)
+
+    interests = np.divide(game_sum, game_cnt, out=np.zeros_like(game_sum), where=game_cnt > 0)
+    for _ in range(rounds):
+        total = game_sum + user_weight * segment_sum(interests[friends], snapshot.friend_indptr)
+        count = game_cnt + segment_sum(interests[friends] > 0, snapshot.friend_indptr)
+        interests = np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+    graph.user_interests[:] = interests
+    return graph.user_interests
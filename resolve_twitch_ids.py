@@ -0,0 +1,8 @@
+from graph import game_name_mapping, load_cache
+from api import TwitchAPI
+
+load_cache()
+
+twitch_api = TwitchAPI("key.conf")
+game_ids = twitch_api.resolve_game_ids(list(game_name_mapping.values()))
+print(f"Resolved {sum(1 for game_id in game_ids.values() if game_id)} of {len(game_ids)} games on Twitch.")
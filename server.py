@@ -0,0 +1,303 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from model import RecommendationModel
+from snapshot import read_published
+
+MAX_K = 100
+MAX_BATCH = 1000
+
+
+class LatencyStats:
+    '''
+    Thread-safe per-endpoint latency recorder.
+
+    The most recent window latencies of every endpoint are kept to compute
+    percentiles, next to the total number of requests and errors.
+    '''
+    def __init__(self, window=10000):
+        self.window = window
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.requests = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, error=False):
+        with self.lock:
+            if endpoint not in self.latencies:
+                self.latencies[endpoint] = deque(maxlen=self.window)
+                self.requests[endpoint] = 0
+                self.errors[endpoint] = 0
+            self.latencies[endpoint].append(seconds)
+            self.requests[endpoint] += 1
+            self.errors[endpoint] += error
+
+    def summary(self):
+        '''
+        Return the request count, error count and p50/p90/p99/max latency in
+        milliseconds of every endpoint.
+        '''
+        with self.lock:
+            samples = {endpoint: np.array(latencies) for endpoint, latencies in self.latencies.items()}
+            requests = dict(self.requests)
+            errors = dict(self.errors)
+
+        summary = {}
+        for endpoint, latencies in sorted(samples.items()):
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+            summary[endpoint] = {
+                'requests': requests[endpoint],
+                'errors': errors[endpoint],
+                'p50_ms': round(float(p50), 3),
+                'p90_ms': round(float(p90), 3),
+                'p99_ms': round(float(p99), 3),
+                'max_ms': round(float(latencies.max()) * 1000, 3),
+            }
+        return summary
+
+
+
+class RecommendationService:
+    '''
+    Keeps a warm RecommendationModel built from a snapshot directory and
+    answers recommendation queries for any user.
+
+    Reloading builds the new model next to the current one and swaps it in
+    with a single assignment, so requests in flight finish on the model they
+    started with and no request ever waits for a reload. With watch_interval
+    set, the snapshot directory is polled and reloaded whenever
+    compile_snapshot.py writes a new snapshot.
+
+    Attributes:
+    ----------
+    model : RecommendationModel
+        The model currently serving requests.
+    stats : LatencyStats
+        The latencies of the requests served.
+    '''
+    def __init__(self, snapshot_dir='graph_snapshot', k=5, watch_interval=None, **model_kwargs):
+        self.snapshot_dir = snapshot_dir
+        self.k = k
+        self.model_kwargs = model_kwargs
+        self.stats = LatencyStats()
+        self.reload_lock = threading.Lock()
+        self.model = None
+        self.version = None
+        self.loaded_at = None
+        self.reload()
+
+        if watch_interval:
+            watcher = threading.Thread(target=self._watch, args=(watch_interval,), daemon=True)
+            watcher.start()
+
+    def _snapshot_version(self):
+        stat = read_published(self.snapshot_dir, lambda directory: os.stat(os.path.join(directory, 'meta.json')))
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def reload(self):
+        '''
+        Build a model from the snapshot directory and swap it in.
+
+        Returns:
+        --------
+        dict
+            The number of users of the new model and the time taken to build it.
+        '''
+        with self.reload_lock:
+            start = time.perf_counter()
+            version = self._snapshot_version()
+            model = RecommendationModel.from_snapshot(self.snapshot_dir, **self.model_kwargs)
+            if len(model.graph):
+                model.graph.index(next(iter(model.graph)))  # build the id index before serving
+            self.model, self.version, self.loaded_at = model, version, time.time()
+            return {'users': len(model.graph), 'seconds': round(time.perf_counter() - start, 3)}
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                if self._snapshot_version() != self.version:
+                    self.reload()
+            except (OSError, ValueError) as e:
+                print(f"Failed to reload snapshot {self.snapshot_dir}: {e}")
+
+    def recommend(self, kind, user_id, k=None):
+        '''
+        Return the recommendations of the given kind ("users", "games",
+        "genres" or "all") for one user, or None if the user is unknown.
+        '''
+        model = self.model
+        if user_id not in model:
+            return None
+        k = k or self.k
+        if kind == 'users':
+            return format_users(model.recommend_users(user_id, k))
+        if kind == 'games':
+            return model.recommend_games(user_id, k)
+        if kind == 'genres':
+            return format_genres(model.recommend_genres(user_id, k))
+        return format_recommendation(model.recommend(user_id, k))
+
+    def recommend_many(self, user_ids, k=None):
+        '''
+        Return the recommendations of many users, and the ids that are unknown.
+        '''
+        model = self.model
+        known = [str(user_id) for user_id in user_ids if user_id in model]
+        unknown = [user_id for user_id in user_ids if user_id not in model]
+        results = model.recommend_many(known, k or self.k)
+        return {user_id: format_recommendation(result) for user_id, result in results.items()}, unknown
+
+    def status(self):
+        return {
+            'snapshot_dir': self.snapshot_dir,
+            'users': len(self.model.graph),
+            'loaded_at': self.loaded_at,
+            'endpoints': self.stats.summary(),
+        }
+
+
+
+def parse_k(value, maximum=MAX_K):
+    '''
+    Validate the k of a request, None if it was not given.
+
+    Raises:
+    -------
+    ValueError
+        If k is not an integer of at least 1; larger values are clamped to maximum.
+    '''
+    if value is None:
+        return None
+    try:
+        k = int(value) if isinstance(value, (int, str)) and not isinstance(value, bool) else 0
+    except ValueError:
+        k = 0
+    if k < 1:
+        raise ValueError(f"k must be an integer of at least 1, got {value!r}")
+    return min(k, maximum)
+
+
+def format_users(users):
+    return [{'steamid': user_id, 'similarity': similarity} for user_id, similarity in users]
+
+
+def format_genres(genres):
+    return [{'genre': genre, 'score': score} for genre, score in genres]
+
+
+def format_recommendation(recommendation):
+    return {
+        'users': format_users(recommendation['users']),
+        'games': recommendation['games'],
+        'genres': format_genres(recommendation['genres']),
+    }
+
+
+
+class RecommendationHandler(BaseHTTPRequestHandler):
+    '''
+    JSON endpoints of the recommendation server:
+
+    GET  /users/<steamid>?k=5      similar users
+    GET  /games/<steamid>?k=5      recommended games
+    GET  /genres/<steamid>?k=5     recommended genres
+    GET  /recommend/<steamid>?k=5  all of the above
+    POST /batch                    {"user_ids": [...], "k": 5}, at most MAX_BATCH users
+    POST /reload                   reload the snapshot directory
+    GET  /stats                    model status and per-endpoint latencies
+    '''
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are sent separately; without TCP_NODELAY the body of
+    # every response on a kept-alive connection waits for a delayed ACK.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        query = parse_qs(url.query)
+        if parts[0] in ('users', 'games', 'genres', 'recommend') and len(parts) == 2:
+            self._serve(parts[0], self._recommend, parts[0], parts[1], query)
+        elif parts == ['stats']:
+            self._serve('stats', lambda: (200, self.server.service.status()))
+        else:
+            self._serve('unknown', lambda: (404, {'error': f"Unknown endpoint {url.path}"}))
+
+    def do_POST(self):
+        path = urlparse(self.path).path.strip('/')
+        if path == 'batch':
+            self._serve('batch', self._batch)
+        elif path == 'reload':
+            self._serve('reload', lambda: (200, self.server.service.reload()))
+        else:
+            self._serve('unknown', lambda: (404, {'error': f"Unknown endpoint /{path}"}))
+
+    def _recommend(self, kind, user_id, query):
+        result = self.server.service.recommend(kind, user_id, parse_k(query.get('k', [None])[0]))
+        if result is None:
+            return 404, {'error': f"Unknown user {user_id}"}
+        return 200, {'steamid': user_id, kind: result}
+
+    def _batch(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if not isinstance(body, dict) or not isinstance(body.get('user_ids', []), list):
+            raise ValueError('Expected a JSON object with a list of "user_ids"')
+        if len(body.get('user_ids', [])) > MAX_BATCH:
+            raise ValueError(f"At most {MAX_BATCH} user_ids per batch, got {len(body['user_ids'])}")
+        results, unknown = self.server.service.recommend_many([str(user_id) for user_id in body.get('user_ids', [])],
+                                                              parse_k(body.get('k')))
+        return 200, {'results': results, 'unknown': unknown}
+
+    def _serve(self, endpoint, handler, *args):
+        start = time.perf_counter()
+        try:
+            status, payload = handler(*args)
+        except (ValueError, KeyError) as e:
+            status, payload = 400, {'error': str(e)}
+        except Exception as e:
+            status, payload = 500, {'error': str(e)}
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.service.stats.record(endpoint, time.perf_counter() - start, status >= 400)
+
+    def log_message(self, format, *args):
+        pass
+
+
+
+def make_server(service, host='127.0.0.1', port=8000):
+    '''
+    Create a threaded HTTP server for a RecommendationService; every request
+    is handled on its own thread against the current warm model.
+    '''
+    server = ThreadingHTTPServer((host, port), RecommendationHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve recommendations for every user of a graph snapshot.")
+    parser.add_argument('--snapshot', default='graph_snapshot')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--watch', type=float, default=5.0, help="seconds between snapshot checks, 0 to disable")
+    args = parser.parse_args()
+
+    service = RecommendationService(args.snapshot, watch_interval=args.watch)
+    server = make_server(service, args.host, args.port)
+    print(f"Serving {len(service.model.graph)} users on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,120 @@
+import numpy as np
+
+from vocabulary import GenreVocabulary
+
+
+def normalize_rows(matrix):
+    '''
+    L2-normalize the rows of a matrix, leaving all-zero rows at zero.
+    '''
+    matrix = np.asarray(matrix, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+
+def top_k(scores, k):
+    '''
+    Return the indices of the k largest scores, best first, using a partial
+    selection instead of sorting all scores. Ties keep the lower index first.
+
+    Parameters:
+    -----------
+    scores : np.ndarray
+        A 1-D array of scores, or a 2-D array to select from every row.
+    k : int
+        The number of indices to return.
+    '''
+    scores = np.asarray(scores)
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k == 0:
+        return np.zeros(scores.shape[:-1] + (0,), dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape)
+    values = np.take_along_axis(scores, candidates, axis=-1)
+    order = np.lexsort((candidates, -values), axis=-1)
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+
+class SimilarityEngine:
+    '''
+    Cosine similarity between users over their interest vectors.
+
+    The interest vectors of all users are L2-normalized once, after which
+    the similarity of a user to everyone is one matrix-vector product, and
+    that of many users at once one matrix-matrix product.
+
+    Attributes:
+    ----------
+    user_ids : list
+        The Steam id of every row.
+    vectors : np.ndarray
+        The normalized users x genres interest matrix.
+    eligible : np.ndarray
+        Boolean mask of the users that may be recommended (those owning games).
+    '''
+    def __init__(self, user_ids, interests, eligible=None):
+        self.user_ids = list(user_ids)
+        self.index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self.vectors = normalize_rows(interests)
+        self.eligible = np.ones(len(self.user_ids), dtype=bool) if eligible is None else np.asarray(eligible, dtype=bool)
+
+    @classmethod
+    def from_graph(cls, graph):
+        '''
+        Build the engine from an ArrayGraph or from the Node dictionary returned by build_graph.
+        '''
+        if hasattr(graph, 'user_interests'):
+            snapshot = graph.snapshot
+            return cls(list(graph), graph.user_interests, np.diff(snapshot.own_indptr) > 0)
+
+        vocabulary = GenreVocabulary()
+        rows = []
+        for node in graph.values():
+            rows.append([(vocabulary.add(genre), score) for genre, score in node.interests])
+        interests = np.zeros((len(rows), len(vocabulary)))
+        for i, row in enumerate(rows):
+            for genre, score in row:
+                interests[i, genre] = score
+        return cls(list(graph), interests, [node.owns_games() for node in graph.values()])
+
+    def scores(self, user_ids):
+        '''
+        Return the similarity of each of the given users (rows) to every user (columns).
+        '''
+        rows = self.vectors[[self.index[str(user_id)] for user_id in user_ids]]
+        return rows @ self.vectors.T
+
+    def recommend(self, user_id, k=5):
+        '''
+        Return the k users most similar to user_id as (user ID, similarity) tuples.
+        '''
+        return self.recommend_many([user_id], k)[0]
+
+    def neighbours(self, rows, k=5):
+        '''
+        Return the k most similar eligible users of each of the given row
+        indices, as an index matrix and a similarity matrix. Rows with fewer
+        than k candidates are padded with similarity -inf.
+        '''
+        rows = np.asarray(rows, dtype=np.int64)
+        scores = self.vectors[rows] @ self.vectors.T
+        scores[:, ~self.eligible] = -np.inf
+        scores[np.arange(len(rows)), rows] = -np.inf
+        best = top_k(scores, k)
+        return best, np.take_along_axis(scores, best, axis=-1)
+
+    def recommend_many(self, user_ids, k=5):
+        '''
+        Return the k most similar users for each of the given users, scoring
+        all of them with a single matrix-matrix product.
+        '''
+        best, scores = self.neighbours([self.index[str(user_id)] for user_id in user_ids], k)
+        results = []
+        for indices, row in zip(best, scores):
+            results.append([(self.user_ids[i], float(score)) for i, score in zip(indices, row) if score != -np.inf])
+        return results
@@ -0,0 +1,280 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from vocabulary import GenreVocabulary
+
+SNAPSHOT_VERSION = 1
+
+ARRAYS = [
+    'user_ids', 'user_sorted_ids', 'user_sort_index',
+    'friend_indptr', 'friend_indices',
+    'own_indptr', 'own_indices', 'own_playtime',
+    'game_ids', 'game_genre_indptr', 'game_genre_indices',
+]
+
+
+class Snapshot:
+    '''
+    Compiled, read-only form of the crawled data.
+
+    Users and games are numbered by their position in user_ids and game_ids
+    (users in crawl order, so index 0 is the root user; games in order of
+    first ownership). Friendships, ownerships and game genres are CSR
+    adjacency arrays: the neighbours of row i are indices[indptr[i]:indptr[i + 1]].
+    When loaded from disk the arrays are memory-mapped, so loading is
+    independent of the data size and processes opening the same snapshot
+    share its pages.
+
+    Attributes:
+    ----------
+    user_ids : np.ndarray
+        int64 Steam id of every user.
+    friend_indptr, friend_indices : np.ndarray
+        CSR user-user adjacency (only friends that are in the snapshot).
+    own_indptr, own_indices, own_playtime : np.ndarray
+        CSR user-game adjacency with the playtime of every ownership.
+    game_ids : np.ndarray
+        int64 app id of every game.
+    game_genre_indptr, game_genre_indices : np.ndarray
+        CSR game-genre adjacency into the genre vocabulary.
+    vocabulary : GenreVocabulary
+        The genre vocabulary.
+    game_names : list
+        The name of every game, None if Steam had no details.
+    '''
+    def __init__(self, arrays, genres, game_names):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.vocabulary = GenreVocabulary(genres)
+        self.game_names = game_names
+
+    @property
+    def genres(self):
+        return self.vocabulary.genres
+
+    @property
+    def num_users(self):
+        return len(self.user_ids)
+
+    @property
+    def num_games(self):
+        return len(self.game_ids)
+
+    def user_index(self, user_id):
+        '''
+        Return the index of a Steam id, or None if the user is not in the snapshot.
+        '''
+        user_id = int(user_id)
+        pos = np.searchsorted(self.user_sorted_ids, user_id)
+        if pos < len(self.user_sorted_ids) and self.user_sorted_ids[pos] == user_id:
+            return int(self.user_sort_index[pos])
+        return None
+
+    def friends(self, user):
+        return self.friend_indices[self.friend_indptr[user]:self.friend_indptr[user + 1]]
+
+    def games(self, user):
+        start, end = self.own_indptr[user], self.own_indptr[user + 1]
+        return self.own_indices[start:end], self.own_playtime[start:end]
+
+    def game_genres(self, game):
+        return self.game_genre_indices[self.game_genre_indptr[game]:self.game_genre_indptr[game + 1]]
+
+    def game_name_mapping(self):
+        return {str(game_id): name for game_id, name in zip(self.game_ids.tolist(), self.game_names) if name is not None}
+
+    def game_interests_mapping(self):
+        return {str(game_id): [self.genres[genre] for genre in self.game_genres(game)]
+                for game, (game_id, name) in enumerate(zip(self.game_ids.tolist(), self.game_names))
+                if name is not None}
+
+
+
+def compile_snapshot(user_friend_graph, user_game_mapping, game_detail):
+    '''
+    Turn the cached crawl data into a Snapshot.
+
+    Parameters:
+    -----------
+    user_friend_graph : dict
+        A dictionary representing the user friend relationships.
+    user_game_mapping : dict
+        A dictionary mapping users to their owned games and playtimes.
+    game_detail : dict
+        A dictionary mapping game ids (as strings) to their Steam details.
+
+    Returns:
+    --------
+    Snapshot
+        The compiled snapshot, with in-memory arrays.
+    '''
+    user_list = list(user_friend_graph)
+    user_index = {user: i for i, user in enumerate(user_list)}
+
+    friend_indptr = [0]
+    friend_indices = []
+    for user in user_list:
+        friend_indices.extend(user_index[friend] for friend in user_friend_graph[user] if friend in user_index)
+        friend_indptr.append(len(friend_indices))
+
+    game_index = {}
+    own_indptr = [0]
+    own_indices = []
+    own_playtime = []
+    for user in user_list:
+        for g in user_game_mapping.get(user, []):
+            game_id = str(g["appid"])
+            if game_id not in game_index:
+                game_index[game_id] = len(game_index)
+            own_indices.append(game_index[game_id])
+            own_playtime.append(g["playtime_forever"])
+        own_indptr.append(len(own_indices))
+
+    vocabulary = GenreVocabulary()
+    game_genre_indptr = [0]
+    game_genre_indices = []
+    game_names = []
+    for game_id in game_index:
+        detail = game_detail.get(game_id, game_detail.get(int(game_id)))
+        game_names.append(detail.get("name") if detail else None)
+        for item in (detail or {}).get("genres", []):
+            game_genre_indices.append(vocabulary.add(item["description"]))
+        game_genre_indptr.append(len(game_genre_indices))
+
+    user_ids = np.array([int(user) for user in user_list], dtype=np.int64)
+    user_sort_index = np.argsort(user_ids, kind='stable').astype(np.int32)
+    arrays = {
+        'user_ids': user_ids,
+        'user_sorted_ids': user_ids[user_sort_index],
+        'user_sort_index': user_sort_index,
+        'friend_indptr': np.array(friend_indptr, dtype=np.int64),
+        'friend_indices': np.array(friend_indices, dtype=np.int32),
+        'own_indptr': np.array(own_indptr, dtype=np.int64),
+        'own_indices': np.array(own_indices, dtype=np.int32),
+        'own_playtime': np.array(own_playtime, dtype=np.int32),
+        'game_ids': np.array([int(game_id) for game_id in game_index], dtype=np.int64),
+        'game_genre_indptr': np.array(game_genre_indptr, dtype=np.int64),
+        'game_genre_indices': np.array(game_genre_indices, dtype=np.int32),
+    }
+    return Snapshot(arrays, vocabulary.genres, game_names)
+
+
+
+def compile_cache(cache, snapshot_dir='graph_snapshot'):
+    '''
+    Compile the data of an APICache and save it as a snapshot directory.
+    '''
+    snapshot = compile_snapshot(cache.get("user_friend_graph"), cache.get("user_game_mapping"),
+                                cache.get("game_detail"))
+    save_snapshot(snapshot, snapshot_dir)
+    return snapshot
+
+
+
+def publish_directory(tmp_dir, directory):
+    '''
+    Replace directory with the completely written tmp_dir.
+
+    This takes two renames, directory to directory.old and tmp_dir to
+    directory, so it is not atomic: in between, directory does not exist,
+    and a reader opening files one by one could mix the two versions.
+    Readers go through read_published, which handles both.
+    '''
+    old_dir = directory + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(directory):
+        os.rename(directory, old_dir)
+    os.rename(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+
+def read_published(directory, read, attempts=5, delay=0.1):
+    '''
+    Call read on a directory written by publish_directory and return its result.
+
+    While a new version is being swapped in, the previous one is read from
+    directory.old instead. A read is only accepted if meta.json, written
+    last, is the same file before and after it; otherwise it is retried,
+    also if it failed, since np.load can open a file twice and see two
+    versions of it.
+
+    Parameters:
+    -----------
+    directory : str
+        The published directory.
+    read : function
+        A function reading a directory.
+    attempts : int
+        The number of attempts.
+    delay : float
+        The seconds to wait between attempts.
+
+    Raises:
+    -------
+    FileNotFoundError
+        If no complete version could be read.
+    OSError, ValueError
+        The error of read if the directory did not change during it.
+    '''
+    def version(path):
+        try:
+            stat = os.stat(os.path.join(path, 'meta.json'))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(delay)
+        for path in (directory, directory + '.old'):
+            before = version(path)
+            if before is None:
+                continue
+            try:
+                result = read(path)
+            except (OSError, ValueError):
+                if version(path) == before:
+                    raise
+                continue
+            if version(path) == before:
+                return result
+    raise FileNotFoundError(f"No complete directory at {directory}")
+
+
+
+def save_snapshot(snapshot, snapshot_dir='graph_snapshot'):
+    '''
+    Write a snapshot as one .npy file per array plus a meta.json, next to
+    the old snapshot, and publish it with publish_directory.
+    '''
+    tmp_dir = snapshot_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name in ARRAYS:
+        np.save(os.path.join(tmp_dir, name + '.npy'), getattr(snapshot, name))
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as file:
+        json.dump({'version': SNAPSHOT_VERSION, 'genres': snapshot.genres, 'game_names': snapshot.game_names}, file)
+    publish_directory(tmp_dir, snapshot_dir)
+
+
+
+def load_snapshot(snapshot_dir='graph_snapshot', mmap=True):
+    '''
+    Load a snapshot directory, memory-mapping its arrays unless mmap is False.
+    A snapshot being replaced by save_snapshot is read through read_published.
+    '''
+    def read(directory):
+        with open(os.path.join(directory, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+        if meta['version'] != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {meta['version']}, recompile the snapshot.")
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r' if mmap else None)
+                  for name in ARRAYS}
+        return Snapshot(arrays, meta['genres'], meta['game_names'])
+
+    return read_published(snapshot_dir, read)
@@ -0,0 +1,276 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from collections.abc import MutableMapping
+
+from metrics import metrics
+
+
+BATCH_SIZE = 1000
+COMPRESSION_LEVEL = 6
+
+_MISSING = object()
+
+
+class APICache:
+    '''
+    Cache of crawled data in an embedded SQLite database.
+
+    Every top-level key ("user_friend_graph", "user_game_mapping", ...) is a
+    section. Dictionary values are stored one row per entry, so get returns
+    a lazy CacheSection that only reads the entries it is asked for. Writes
+    are staged in memory and committed by save_cache in one transaction that
+    only touches the sections and entries changed since the last save.
+
+    As with the JSON file this class replaces, keys of stored dictionaries
+    always come back as strings.
+
+    Entries of the compressed sections are stored as zlib-compressed JSON.
+    Either form is read back transparently, so sections can be switched to
+    compression without migrating existing rows.
+
+    Attributes:
+    ----------
+    cache_file : str
+        The path of the SQLite database.
+    compressed_sections : tuple
+        The names of the sections whose entries are written compressed.
+    '''
+    def __init__(self, cache_file='api_cache.db', compressed_sections=('game_detail',)):
+        self.cache_file = cache_file
+        self.compressed_sections = compressed_sections
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS sections (name TEXT PRIMARY KEY, kind TEXT NOT NULL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS entries (section TEXT NOT NULL, key TEXT NOT NULL, '
+                          'value TEXT NOT NULL, PRIMARY KEY (section, key))')
+        # Entries of a secondary index are ordered by rowid, which keeps section scans in insertion order.
+        self.conn.execute('CREATE INDEX IF NOT EXISTS entries_by_section ON entries (section)')
+        self.conn.commit()
+        self.pending = {}
+        self.pending_entries = {}
+
+    def load_cache(self):
+        '''
+        Read every section into memory, for callers that need the whole cache as plain dictionaries.
+        '''
+        data = {}
+        for name in self.section_names():
+            value = self.get(name)
+            data[name] = dict(value.items()) if isinstance(value, CacheSection) else value
+        return data
+
+    def section_names(self):
+        with self.lock:
+            names = [row[0] for row in self.conn.execute('SELECT name FROM sections ORDER BY rowid')]
+        names += [name for name in list(self.pending) + list(self.pending_entries) if name not in names]
+        return names
+
+    def get(self, key):
+        if key in self.pending:
+            metrics.increment('cache_hits_total', section=key)
+            return self.pending[key]
+        with self.lock:
+            row = self.conn.execute('SELECT kind FROM sections WHERE name = ?', (key,)).fetchone()
+            if row is None:
+                if key in self.pending_entries:
+                    metrics.increment('cache_hits_total', section=key)
+                    return CacheSection(self, key)
+                metrics.increment('cache_misses_total', section=key)
+                return None
+            metrics.increment('cache_hits_total', section=key)
+            if row[0] == 'value':
+                return decode(self.conn.execute('SELECT value FROM entries WHERE section = ? AND key = ?',
+                                                    (key, '')).fetchone()[0])
+        return CacheSection(self, key)
+
+    def set(self, key, value):
+        if isinstance(value, CacheSection) and value.cache is self and value.name == key:
+            return
+        self.pending[key] = value
+        self.pending_entries.pop(key, None)
+
+    def update(self, key, entries):
+        '''
+        Stage individual entries of a dictionary section without rewriting the rest of it.
+        '''
+        if key in self.pending:
+            self.pending[key].update(entries)
+            return
+        self.pending_entries.setdefault(key, {}).update((str(k), v) for k, v in entries.items())
+
+    def save_cache(self):
+        with self.lock, self.conn:
+            for name, value in self.pending.items():
+                self.conn.execute('DELETE FROM entries WHERE section = ?', (name,))
+                if isinstance(value, (dict, CacheSection)):
+                    self._write_section(name, 'map', ((str(k), v) for k, v in value.items()))
+                else:
+                    self._write_section(name, 'value', [('', value)])
+            for name, entries in self.pending_entries.items():
+                self._write_section(name, 'map', entries.items())
+        self.pending = {}
+        self.pending_entries = {}
+
+    def vacuum(self):
+        '''
+        Rebuild the database file to release the space of rewritten entries.
+        '''
+        with self.lock:
+            self.conn.execute('VACUUM')
+
+    def _write_section(self, name, kind, items):
+        compress = name in self.compressed_sections
+        self.conn.execute('INSERT INTO sections (name, kind) VALUES (?, ?) '
+                          'ON CONFLICT (name) DO UPDATE SET kind = excluded.kind', (name, kind))
+        self.conn.executemany('INSERT INTO entries (section, key, value) VALUES (?, ?, ?) '
+                              'ON CONFLICT (section, key) DO UPDATE SET value = excluded.value',
+                              ((name, k, encode(v, compress)) for k, v in items))
+
+
+
+class CacheSection(MutableMapping):
+    '''
+    Lazy dictionary view of one section of an APICache.
+
+    Reads go to the database entry by entry (entries staged but not yet
+    saved take precedence), and assignments are staged in the cache until
+    its next save_cache. Deletions drop the staged entry and delete the
+    stored one right away.
+    '''
+    def __init__(self, cache, name):
+        self.cache = cache
+        self.name = name
+
+    def _staged(self):
+        return self.cache.pending_entries.get(self.name, {})
+
+    def __getitem__(self, key):
+        key = str(key)
+        staged = self._staged()
+        if key in staged:
+            metrics.increment('cache_hits_total', section=self.name)
+            return staged[key]
+        with self.cache.lock:
+            row = self.cache.conn.execute('SELECT value FROM entries WHERE section = ? AND key = ?',
+                                          (self.name, key)).fetchone()
+        if row is None:
+            metrics.increment('cache_misses_total', section=self.name)
+            raise KeyError(key)
+        metrics.increment('cache_hits_total', section=self.name)
+        return decode(row[0])
+
+    def __setitem__(self, key, value):
+        self.cache.update(self.name, {key: value})
+
+    def __delitem__(self, key):
+        key = str(key)
+        staged = self._staged().pop(key, _MISSING) is not _MISSING
+        with self.cache.lock, self.cache.conn:
+            stored = self.cache.conn.execute('DELETE FROM entries WHERE section = ? AND key = ?',
+                                             (self.name, key)).rowcount > 0
+        if not (staged or stored):
+            raise KeyError(key)
+
+    def clear(self):
+        self._staged().clear()
+        with self.cache.lock, self.cache.conn:
+            self.cache.conn.execute('DELETE FROM entries WHERE section = ?', (self.name,))
+
+    def __contains__(self, key):
+        key = str(key)
+        if key in self._staged():
+            found = True
+        else:
+            with self.cache.lock:
+                found = self.cache.conn.execute('SELECT 1 FROM entries WHERE section = ? AND key = ?',
+                                                (self.name, key)).fetchone() is not None
+        metrics.increment('cache_hits_total' if found else 'cache_misses_total', section=self.name)
+        return found
+
+    def __iter__(self):
+        for key, _ in self.items():
+            yield key
+
+    def __len__(self):
+        with self.cache.lock:
+            stored = self.cache.conn.execute('SELECT COUNT(*) FROM entries WHERE section = ?',
+                                             (self.name,)).fetchone()[0]
+        return stored + sum(1 for key in self._staged() if not self._stored(key))
+
+    def items(self):
+        '''
+        Stream the entries of the section in insertion order, reading the
+        database in batches so that large sections are never fully loaded.
+        '''
+        staged = dict(self._staged())
+        last_rowid = -1
+        while True:
+            with self.cache.lock:
+                rows = self.cache.conn.execute('SELECT rowid, key, value FROM entries WHERE section = ? AND rowid > ? '
+                                               'ORDER BY rowid LIMIT ?', (self.name, last_rowid, BATCH_SIZE)).fetchall()
+            if not rows:
+                break
+            for last_rowid, key, value in rows:
+                if key in staged:
+                    yield key, staged.pop(key)
+                else:
+                    yield key, decode(value)
+        yield from staged.items()
+
+    def values(self):
+        for _, value in self.items():
+            yield value
+
+    def _stored(self, key):
+        with self.cache.lock:
+            return self.cache.conn.execute('SELECT 1 FROM entries WHERE section = ? AND key = ?',
+                                           (self.name, key)).fetchone() is not None
+
+
+
+def encode(value, compress=False):
+    '''
+    Serialize a cache entry as JSON text, or as zlib-compressed JSON bytes with compress set.
+    '''
+    text = json.dumps(value)
+    return zlib.compress(text.encode(), COMPRESSION_LEVEL) if compress else text
+
+
+
+def decode(value):
+    if isinstance(value, bytes):
+        value = zlib.decompress(value)
+    return json.loads(value)
+
+
+
+def migrate_json_cache(json_file='api_cache.json', cache_file='api_cache.db'):
+    '''
+    Copy a cache written by the former JSON APICache into an SQLite APICache.
+
+    Parameters:
+    -----------
+    json_file : str
+        The path of the JSON cache.
+    cache_file : str
+        The path of the SQLite database to create or update.
+
+    Returns:
+    --------
+    APICache
+        The migrated cache.
+    '''
+    if not os.path.exists(json_file):
+        raise FileNotFoundError(json_file)
+    with open(json_file, 'r') as file:
+        data = json.load(file)
+
+    cache = APICache(cache_file)
+    for key, value in data.items():
+        cache.set(key, value)
+    cache.save_cache()
+    return cache
@@ -0,0 +1,100 @@
+import json
+import os
+import time
+
+
+class CrawlStream:
+    '''
+    Newline-delimited JSON output of a crawl.
+
+    Every crawled user is written as one record as soon as its chunk is
+    done, and every game once its details are known, so other processes can
+    consume the crawl while it runs (see read_records). A record is one of
+
+    {"type": "user", "steamid": ..., "friends": [...], "games": [{"appid", "playtime_forever"}, ...]}
+    {"type": "app", "appid": ..., "detail": {...} or null}
+    {"type": "end"}
+
+    Attributes:
+    ----------
+    stream_file : str
+        The path of the NDJSON file.
+    '''
+    def __init__(self, stream_file='crawl_stream.ndjson', append=False):
+        self.stream_file = stream_file
+        self.file = open(stream_file, 'a' if append else 'w')
+
+    def write_user(self, user_id, friends, games):
+        self._write({"type": "user", "steamid": user_id, "friends": friends, "games": games})
+
+    def write_app(self, app_id, detail):
+        self._write({"type": "app", "appid": app_id, "detail": detail})
+
+    def end(self):
+        self._write({"type": "end"})
+        self.flush()
+        self.file.close()
+
+    def flush(self):
+        '''
+        Make the records written so far visible to readers.
+        '''
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def _write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+
+
+
+def read_records(stream_file='crawl_stream.ndjson', follow=False, poll_interval=0.5):
+    '''
+    Read the records of a crawl stream one at a time.
+
+    Parameters:
+    -----------
+    stream_file : str
+        The path of the NDJSON file.
+    follow : bool
+        Whether to keep waiting for new records at the end of the file, like
+        tail -f, until the end record of the crawl arrives.
+    poll_interval : float
+        The number of seconds to wait for new records when following.
+
+    Yields:
+    -------
+    dict
+        The records of the stream, up to and including the end record.
+    '''
+    while follow and not os.path.exists(stream_file):
+        time.sleep(poll_interval)
+
+    with open(stream_file, 'r') as file:
+        while True:
+            position = file.tell()
+            line = file.readline()
+            if not line.endswith('\n'):
+                # Nothing new, or a record that is still being written
+                if not follow:
+                    return
+                file.seek(position)
+                time.sleep(poll_interval)
+                continue
+            record = json.loads(line)
+            yield record
+            if record["type"] == "end":
+                return
+
+
+
+def user_records(records):
+    '''
+    Keep the first record of every user, dropping the duplicates a resumed crawl may write.
+    '''
+    seen = set()
+    for record in records:
+        if record["type"] == "user":
+            if record["steamid"] in seen:
+                continue
+            seen.add(record["steamid"])
+        yield record
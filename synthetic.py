@@ -0,0 +1,198 @@
+import numpy as np
+
+from snapshot import Snapshot
+from vocabulary import GenreVocabulary
+
+# Steam store genres with the approximate share of games that carry them
+STEAM_GENRES = [
+    ("Indie", 0.45), ("Action", 0.40), ("Adventure", 0.30), ("Casual", 0.25), ("RPG", 0.20),
+    ("Strategy", 0.18), ("Simulation", 0.18), ("Early Access", 0.10), ("Free to Play", 0.10),
+    ("Massively Multiplayer", 0.05), ("Sports", 0.05), ("Racing", 0.05),
+]
+
+
+def sorted_unique(values):
+    '''
+    Return the sorted distinct values of an integer array.
+    '''
+    values = np.sort(values)
+    return values[np.concatenate([[True], values[1:] != values[:-1]])] if len(values) else values
+
+
+
+def generate_network(num_users, seed=0, num_games=None, min_degree=3, degree_exponent=2.5, max_degree=300,
+                     median_games=8, private_share=0.1, median_playtime=2500, missing_detail_share=0.05):
+    '''
+    Generate a synthetic crawl of the Steam friend network.
+
+    Friend degrees follow a power law (Pareto with the given exponent,
+    capped at max_degree) and are wired with the configuration model, plus a
+    random tree so the network is connected like a crawl from one root.
+    The number of games per user is log-normal (with a share of private
+    profiles owning nothing), which games are owned follows a Zipf
+    popularity, playtimes are log-normal above the 600 minutes kept by
+    filter_game_list, and genres are drawn with their Steam frequencies.
+    Everything is generated with vectorized NumPy, so 1M users take seconds.
+
+    Parameters:
+    -----------
+    num_users : int
+        The number of users.
+    seed : int
+        The random seed; the same seed gives the same network.
+    num_games : int
+        The number of games, num_users / 5 (between 200 and 50000) by default.
+
+    Returns:
+    --------
+    dict
+        CSR arrays in the layout of a Snapshot (user_ids, friend_indptr,
+        friend_indices, own_indptr, own_indices, own_playtime, game_ids) plus
+        game_details, the detail dictionary of every game (None for games
+        without details).
+    '''
+    rng = np.random.default_rng(seed)
+    if num_games is None:
+        num_games = int(min(50000, max(200, num_users // 5)))
+
+    # Friendships: configuration model over power-law degrees, plus a random tree
+    degrees = np.minimum(min_degree * (rng.pareto(degree_exponent - 1, num_users) + 1), max_degree).astype(np.int64)
+    stubs = np.repeat(np.arange(num_users), degrees)
+    rng.shuffle(stubs)
+    stubs = stubs[:len(stubs) // 2 * 2].reshape(-1, 2)
+    tree = np.column_stack([np.arange(1, num_users), (rng.random(num_users - 1) * np.arange(1, num_users)).astype(np.int64)])
+    edges = np.concatenate([stubs, tree])
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    pairs = sorted_unique(edges.min(axis=1) * num_users + edges.max(axis=1))
+    pairs = np.sort(np.concatenate([pairs, pairs % num_users * num_users + pairs // num_users]))
+    friend_indptr = np.concatenate([[0], np.cumsum(np.bincount(pairs // num_users, minlength=num_users))])
+
+    # Ownership: log-normal counts, Zipf popularity, log-normal playtimes
+    counts = np.rint(rng.lognormal(np.log(median_games), 1.0, num_users)).astype(np.int64)
+    counts[rng.random(num_users) < private_share] = 0
+    popularity = 1.0 / np.arange(1, num_games + 1) ** 1.1
+    games = rng.choice(num_games, size=counts.sum(), p=popularity / popularity.sum())
+    keys = sorted_unique(np.repeat(np.arange(num_users), counts) * num_games + games)
+    owners, own_indices = keys // num_games, keys % num_games
+    own_indptr = np.concatenate([[0], np.cumsum(np.bincount(owners, minlength=num_users))])
+    own_playtime = (601 + rng.lognormal(np.log(median_playtime), 1.3, len(keys))).astype(np.int32)
+
+    # Games: ids, names and genres; a few games have no details on the store
+    game_ids = np.sort(rng.choice(np.arange(10, 10 * (4 * num_games + 10), 10), num_games, replace=False))
+    names, shares = zip(*STEAM_GENRES)
+    has_genre = rng.random((num_games, len(names))) < np.array(shares)
+    has_genre[np.arange(num_games), rng.choice(len(names), num_games, p=np.array(shares) / sum(shares))] = True
+    missing = rng.random(num_games) < missing_detail_share
+    game_details = [None if missing[game] else
+                    {"name": f"Game {game_ids[game]}",
+                     "genres": [{"id": str(i + 1), "description": names[i]} for i in np.flatnonzero(has_genre[game])]}
+                    for game in range(num_games)]
+
+    return {
+        'user_ids': 76561197960265728 + np.arange(num_users, dtype=np.int64),
+        'friend_indptr': friend_indptr.astype(np.int64),
+        'friend_indices': (pairs % num_users).astype(np.int32),
+        'own_indptr': own_indptr.astype(np.int64),
+        'own_indices': own_indices.astype(np.int32),
+        'own_playtime': own_playtime,
+        'game_ids': game_ids.astype(np.int64),
+        'game_details': game_details,
+    }
+
+
+
+def network_user_records(network, users=None):
+    '''
+    Yield (Steam id, friend ids, game list) for the given user indices, all by default,
+    in the format of the user_friend_graph and user_game_mapping entries.
+    '''
+    user_ids = network['user_ids'].astype(str)
+    game_ids = network['game_ids'].tolist()
+    friend_indptr, friend_indices = network['friend_indptr'], network['friend_indices']
+    own_indptr, own_indices, own_playtime = network['own_indptr'], network['own_indices'], network['own_playtime']
+    for user in range(len(user_ids)) if users is None else users:
+        friends = user_ids[friend_indices[friend_indptr[user]:friend_indptr[user + 1]]].tolist()
+        start, end = own_indptr[user], own_indptr[user + 1]
+        games = [{"appid": game_ids[game], "playtime_forever": playtime}
+                 for game, playtime in zip(own_indices[start:end].tolist(), own_playtime[start:end].tolist())]
+        yield str(user_ids[user]), friends, games
+
+
+
+def network_mappings(network):
+    '''
+    Return the network as the user_friend_graph, user_game_mapping and game_detail dictionaries of the cache.
+    '''
+    user_friend_graph = {}
+    user_game_mapping = {}
+    for user_id, friends, games in network_user_records(network):
+        user_friend_graph[user_id] = friends
+        user_game_mapping[user_id] = games
+    game_detail = {str(game_id): detail for game_id, detail in zip(network['game_ids'].tolist(), network['game_details'])}
+    return user_friend_graph, user_game_mapping, game_detail
+
+
+
+def network_snapshot(network):
+    '''
+    Return the network as a Snapshot without going through the cache dictionaries.
+    '''
+    vocabulary = GenreVocabulary()
+    genre_indptr = [0]
+    genre_indices = []
+    for detail in network['game_details']:
+        genre_indices.extend(vocabulary.add(item["description"]) for item in (detail or {}).get("genres", []))
+        genre_indptr.append(len(genre_indices))
+
+    user_ids = network['user_ids']
+    user_sort_index = np.argsort(user_ids, kind='stable').astype(np.int32)
+    arrays = {name: network[name] for name in ('user_ids', 'friend_indptr', 'friend_indices',
+                                               'own_indptr', 'own_indices', 'own_playtime', 'game_ids')}
+    arrays.update({
+        'user_sorted_ids': user_ids[user_sort_index],
+        'user_sort_index': user_sort_index,
+        'game_genre_indptr': np.array(genre_indptr, dtype=np.int64),
+        'game_genre_indices': np.array(genre_indices, dtype=np.int32),
+    })
+    return Snapshot(arrays, vocabulary.genres, [detail.get("name") if detail else None for detail in network['game_details']])
+
+
+
+def write_cache(network, cache, batch_size=10000):
+    '''
+    Write the network into an APICache as user_friend_graph, user_game_mapping
+    and game_detail, batch_size users at a time so memory stays bounded.
+    '''
+    num_users = len(network['user_ids'])
+    for start in range(0, num_users, batch_size):
+        friends = {}
+        games = {}
+        for user_id, user_friends, user_games in network_user_records(network, range(start, min(start + batch_size, num_users))):
+            friends[user_id] = user_friends
+            games[user_id] = user_games
+        cache.update("user_friend_graph", friends)
+        cache.update("user_game_mapping", games)
+        cache.save_cache()
+    cache.update("game_detail", dict(zip(network['game_ids'].tolist(), network['game_details'])))
+    cache.save_cache()
+
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from store import APICache
+
+    parser = argparse.ArgumentParser(description="Write a synthetic Steam network into a cache database.")
+    parser.add_argument('num_users', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache', default='synthetic_cache.db')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    network = generate_network(args.num_users, args.seed)
+    write_cache(network, APICache(args.cache))
+    print(f"Wrote {args.num_users} users, {len(network['friend_indices']) // 2} friendships, "
+          f"{len(network['own_indices'])} ownerships and {len(network['game_ids'])} games to {args.cache} "
+          f"in {time.perf_counter() - start:.2f}s.")
@@ -0,0 +1,24 @@
+import random
+
+
+def random_network(num_users, num_games=40, num_genres=8, seed=0):
+    '''
+    Generate a small random crawl (friend graph, game lists and game details)
+    for checking the array engines against the object graph.
+    '''
+    rnd = random.Random(seed)
+    users = [str(76561197960265728 + i) for i in range(num_users)]
+    friends = {user: [] for user in users}
+    for i, user in enumerate(users[1:], 1):
+        for friend in rnd.sample(users[:i], min(i, rnd.randint(1, 3))):
+            friends[user].append(friend)
+            friends[friend].append(user)
+    user_game_mapping = {user: [{"appid": appid, "playtime_forever": rnd.randint(601, 20000)}
+                                for appid in rnd.sample(range(1, num_games + 1), rnd.randint(0, 6))]
+                         for user in users}
+    genres = [f"Genre {i}" for i in range(num_genres)]
+    game_detail = {str(appid): {"name": f"Game {appid}",
+                                "genres": [{"id": str(i), "description": genres[i]}
+                                           for i in sorted(rnd.sample(range(num_genres), rnd.randint(0, 3)))]}
+                   for appid in range(1, num_games + 1)}
+    return friends, user_game_mapping, game_detail
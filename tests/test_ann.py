@@ -0,0 +1,29 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann import LSHIndex
+
+
+@pytest.mark.parametrize('name', ['index.lsh', 'index.npz', 'index'])
+def test_save_load_round_trip(tmp_path, name):
+    rng = np.random.default_rng(0)
+    user_ids = [str(76561197960265728 + i) for i in range(200)]
+    eligible = rng.random(200) > 0.1
+    index = LSHIndex(num_tables=4, num_bits=6, seed=3).build(user_ids, rng.random((200, 8)), eligible)
+
+    path = str(tmp_path / name)
+    index.save(path)
+    loaded = LSHIndex.load(path)
+
+    assert os.listdir(tmp_path) == [name]
+    assert (loaded.num_tables, loaded.num_bits, loaded.seed) == (4, 6, 3)
+    assert loaded.user_ids == user_ids
+    for attribute in ('vectors', 'eligible', 'center', 'planes', 'order', 'sorted_codes'):
+        np.testing.assert_array_equal(getattr(loaded, attribute), getattr(index, attribute))
+    for user_id in user_ids[:20]:
+        assert loaded.query(user_id, 5) == index.query(user_id, 5)
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from array_graph import ArrayGraph
+from model import RecommendationModel
+from synthetic import generate_network, network_snapshot
+
+
+def test_recommend_many_batches_match_one_batch():
+    model = RecommendationModel(ArrayGraph(network_snapshot(generate_network(300, seed=0))))
+    games = model.games
+    users = np.arange(0, 300, 3)
+    best, similarity = games.engine.neighbours(users, games.neighbours)
+    expected_games, expected_scores = games.score(users, best, similarity, 5)
+
+    games.batch_size = 7
+    actual_games, actual_scores = games.recommend_many(users, 5)
+    np.testing.assert_array_equal(actual_games, expected_games)
+    np.testing.assert_allclose(actual_scores, expected_scores)
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from array_graph import ArrayGraph
+from parallel import propagate_interests_parallel, similar_users_parallel
+from propagation import propagate_interests_all
+from similarity import SimilarityEngine
+from synthetic import generate_network, network_snapshot
+
+
+@pytest.fixture(scope='module')
+def snapshot():
+    return network_snapshot(generate_network(20000, 0))
+
+
+def test_parallel_propagation_matches_serial(snapshot):
+    serial = ArrayGraph(snapshot)
+    propagate_interests_all(serial)
+    pooled = ArrayGraph(snapshot)
+    propagate_interests_parallel(pooled, processes=4)
+    np.testing.assert_array_equal(pooled.user_interests, serial.user_interests)
+
+
+def test_parallel_similarity_matches_serial(snapshot):
+    graph = ArrayGraph(snapshot)
+    propagate_interests_all(graph)
+    engine = SimilarityEngine.from_graph(graph)
+    best, scores = similar_users_parallel(engine, 5, processes=4)
+    inline_best, inline_scores = similar_users_parallel(engine, 5, processes=0)
+    np.testing.assert_array_equal(best, inline_best)
+    np.testing.assert_array_equal(scores, inline_scores)
+
+    sample = np.arange(0, snapshot.num_users, max(1, snapshot.num_users // 500))
+    _, expected_scores = engine.neighbours(sample, 5)
+    # Equal -inf padding compares equal, unlike its difference.
+    np.testing.assert_allclose(scores[sample], expected_scores, rtol=0, atol=1e-12)
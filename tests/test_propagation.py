@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import graph as object_graph
+from array_graph import ArrayGraph
+from networks import random_network
+from propagation import propagate_interests_matrix
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matrix_matches_recursive_propagation(seed, num_users=200):
+    friends, user_game_mapping, game_detail = random_network(num_users, seed=seed)
+    game_interests = {game_id: [item["description"] for item in detail["genres"]]
+                      for game_id, detail in game_detail.items()}
+    root = next(iter(friends))
+
+    nodes = object_graph.build_graph(friends, user_game_mapping, game_interests)
+    object_graph.propagate_interests(nodes[root])
+    arrays = ArrayGraph.from_mappings(friends, user_game_mapping, game_detail)
+    propagate_interests_matrix(arrays, root)
+
+    for user, node in nodes.items():
+        expected = dict(node.interests)
+        actual = dict(arrays[user].interests)
+        assert expected.keys() == actual.keys(), f"Genres of user {user} differ"
+        assert actual == pytest.approx(expected, abs=1e-6)
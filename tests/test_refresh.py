@@ -0,0 +1,38 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import AppDetailStore, CrawlCheckpoint, SteamAPI
+from store import APICache
+
+
+def make_api(tmp_path, fetched):
+    key_file = tmp_path / 'key.conf'
+    key_file.write_text(json.dumps({"api_key": "fake", "steam_id": "0"}))
+    cache = APICache(str(tmp_path / 'api_cache.db'))
+    users = [str(i) for i in range(10)]
+    cache.set('user_friend_graph', {user: [] for user in users})
+    cache.set('user_game_mapping', {user: [] for user in users})
+    cache.set('game_detail', {})
+    cache.save_cache()
+
+    api = SteamAPI(str(key_file), cache, AppDetailStore(str(tmp_path / 'details.db')),
+                   CrawlCheckpoint(str(tmp_path / 'checkpoint.json')))
+    api.get_game_list = lambda user: fetched.append(user) or []
+    api.get_friend_list = lambda user: []
+    return api
+
+
+def test_refresh_twice_only_fetches_stale_users(tmp_path):
+    fetched = []
+    make_api(tmp_path, fetched).refresh_data(3600, checkpoint_every=3)
+    assert fetched == [str(i) for i in range(10)]
+
+    # A new cache on the same file sees the timestamps of every chunk, not only the first
+    fetched.clear()
+    api = make_api(tmp_path, fetched)
+    assert len(api.cache.get('user_fetched_at')) == 10
+    api.refresh_data(3600, checkpoint_every=3)
+    assert fetched == []
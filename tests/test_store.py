@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from store import APICache
+
+
+def test_section_deletion(tmp_path):
+    cache = APICache(str(tmp_path / 'api_cache.db'))
+    cache.set('user_game_mapping', {'1': [10], '2': [20], '3': [30]})
+    cache.save_cache()
+    section = cache.get('user_game_mapping')
+    section['4'] = [40]
+
+    del section['1']
+    del section['4']
+    assert section.pop('2') == [20]
+    assert section.pop('5', None) is None
+    with pytest.raises(KeyError):
+        del section['1']
+    assert dict(section.items()) == {'3': [30]}
+    assert len(section) == 1
+
+    cache.save_cache()
+    reopened = APICache(str(tmp_path / 'api_cache.db'))
+    assert dict(reopened.get('user_game_mapping').items()) == {'3': [30]}
+
+    section.clear()
+    assert len(section) == 0 and reopened.get('user_game_mapping').get('3') is None
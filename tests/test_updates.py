@@ -0,0 +1,56 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from array_graph import ArrayGraph
+from networks import random_network
+from propagation import propagate_interests_all
+from updates import IncrementalGraph
+
+
+def random_deltas(graph, num_deltas, seed=0):
+    '''
+    Generate random changes to an IncrementalGraph, including new users and games.
+    '''
+    rnd = random.Random(seed)
+    users = list(graph.user_ids)
+    deltas = []
+    for _ in range(num_deltas):
+        user = rnd.choice(users)
+        index = graph.user_index.get(user)
+        kind = rnd.randrange(5)
+        if kind == 0:
+            deltas.append(("add_friendship", user, rnd.choice(users)))
+        elif kind == 1 and index is not None and graph.friends[index]:
+            friend = graph.user_ids[rnd.choice(list(graph.friends[index]))]
+            deltas.append(("remove_friendship", user, friend))
+        elif kind == 2 and index is not None and graph.games[index]:
+            game = graph.game_ids[rnd.choice(list(graph.games[index]))]
+            deltas.append(("remove_game", user, game))
+        elif kind == 3:
+            new_user = str(int(max(users)) + 1)
+            users.append(new_user)
+            deltas.append(("add_friendship", new_user, user))
+        else:
+            deltas.append(("set_game", user, rnd.choice(graph.game_ids + [10 ** 6 + rnd.randrange(10)]),
+                           rnd.randint(601, 20000), ["Genre 0", "New genre"]))
+    return deltas
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_incremental_matches_rebuild(seed, num_users=500, num_deltas=50):
+    graph = IncrementalGraph.from_mappings(*random_network(num_users, seed=seed))
+    for step in range(3):
+        graph.apply(random_deltas(graph, num_deltas, seed=seed * 10 + step))
+
+    rebuilt = ArrayGraph.from_mappings(*graph.to_mappings())
+    propagate_interests_all(rebuilt, graph.num_rounds, graph.user_weight)
+    for user_id in graph.user_ids:
+        expected = dict(rebuilt[user_id].interests)
+        actual = dict(graph.user_interests(user_id))
+        assert expected.keys() == actual.keys(), f"Genres of user {user_id} differ"
+        assert actual == pytest.approx(expected, abs=1e-9)
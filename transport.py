@@ -0,0 +1,213 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics
+
+
+# Sustained request rate (requests per second) and burst size per host.
+# Pass rate_limits to HTTPTransport to raise a limit, e.g. for a key with a
+# larger quota.
+DEFAULT_RATE_LIMITS = {
+    'api.steampowered.com': (100000 / 86400, 10),  # 100,000 calls per key per day
+    'store.steampowered.com': (200 / 300, 20),  # roughly 200 requests per 5 minutes
+    'api.twitch.tv': (800 / 60, 100),           # 800 points per minute
+    'id.twitch.tv': (1.0, 5),
+}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket limiting the rate of requests to one host.
+
+    Attributes:
+    ----------
+    rate : float
+        The number of tokens added per second.
+    capacity : int
+        The maximum number of tokens, i.e. the largest burst of requests.
+    '''
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Take one token, sleeping until it is available. Tokens are reserved
+        under the lock, so concurrent callers queue up instead of racing.
+        '''
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+
+class EndpointStats:
+    '''
+    Request counters and latencies of one endpoint (host and path).
+    '''
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.status_codes = {}
+
+    def record(self, latency, status_code=None):
+        self.requests += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        if status_code is None or status_code >= 400:
+            self.errors += 1
+        if status_code is not None:
+            self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+
+    def summary(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'mean_latency': self.total_latency / self.requests if self.requests else 0.0,
+            'max_latency': self.max_latency,
+            'status_codes': dict(self.status_codes)
+        }
+
+
+
+class HTTPTransport:
+    '''
+    HTTP client shared by the Steam and Twitch API wrappers.
+
+    Requests go through one pooled keep-alive session per host and are
+    throttled by a per-host token bucket. Responses with a 429 or 5xx status
+    and connection errors are retried with exponential backoff and full
+    jitter, honouring a Retry-After header when the server sends one. When
+    all retries fail the last error is raised instead of returned, so that a
+    throttled crawl stops (and can resume from its checkpoint) rather than
+    silently dropping users.
+
+    Attributes:
+    ----------
+    rate_limits : dict
+        A dictionary mapping hosts to (requests per second, burst size).
+        Hosts without an entry are not throttled.
+    max_retries : int
+        The number of retries after the first attempt.
+    stats : dict
+        A dictionary mapping endpoints ("host/path") to EndpointStats.
+    '''
+    def __init__(self, rate_limits=None, max_retries=5, backoff_base=0.5, backoff_max=60.0,
+                 timeout=30, pool_size=32):
+        self.rate_limits = dict(DEFAULT_RATE_LIMITS)
+        self.rate_limits.update(rate_limits or {})
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.sessions = {}
+        self.buckets = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        '''
+        Send a request, retrying throttled and failed attempts.
+
+        Parameters:
+        -----------
+        method : str
+            The HTTP method.
+        url : str
+            The request URL.
+        kwargs : dict
+            Extra arguments for requests.Session.request (params, data, headers, ...).
+
+        Returns:
+        --------
+        requests.Response
+            The first response that is neither a 429 nor a 5xx.
+        '''
+        parts = urlsplit(url)
+        host = parts.netloc
+        endpoint = host + parts.path
+        session, bucket, stats = self._host_state(host, endpoint)
+        kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            if bucket is not None:
+                bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._record(stats, endpoint, time.perf_counter() - start)
+                if attempt == self.max_retries:
+                    raise
+                self._backoff(stats, endpoint, attempt)
+                continue
+
+            self._record(stats, endpoint, time.perf_counter() - start, response.status_code)
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            if attempt == self.max_retries:
+                response.raise_for_status()
+            self._backoff(stats, endpoint, attempt, response.headers.get('Retry-After'))
+
+    def summary(self):
+        '''
+        Return the per-endpoint counters as a dictionary of plain values.
+        '''
+        with self.lock:
+            return {endpoint: stats.summary() for endpoint, stats in self.stats.items()}
+
+    def _host_state(self, host, endpoint):
+        with self.lock:
+            if host not in self.sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.sessions[host] = session
+                if host in self.rate_limits:
+                    rate, burst = self.rate_limits[host]
+                    self.buckets[host] = TokenBucket(rate, burst)
+            if endpoint not in self.stats:
+                self.stats[endpoint] = EndpointStats()
+            return self.sessions[host], self.buckets.get(host), self.stats[endpoint]
+
+    def _record(self, stats, endpoint, latency, status_code=None):
+        with self.lock:
+            stats.record(latency, status_code)
+        metrics.increment('http_requests_total', endpoint=endpoint, status=status_code or 'error')
+        metrics.observe('http_request_seconds', latency, endpoint=endpoint)
+
+    def _backoff(self, stats, endpoint, attempt, retry_after=None):
+        with self.lock:
+            stats.retries += 1
+        metrics.increment('http_retries_total', endpoint=endpoint)
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        time.sleep(delay)
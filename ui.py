@@ -41,15 +41,18 @@ def display_recommended_genres(genres):
 
 
 
+load_cache()
 root = list(user_friend_graph.keys())[0]
 g = build_graph(user_friend_graph, user_game_mapping)
 
 propagate_interests(g[root])
-similar_users = recommend_users(g, root, 3)
+engine = SimilarityEngine.from_graph(g)
+similar_users = recommend_users(g, root, 3, engine)
 similar_user = similar_users[0][0]
 recommended_games = recommend_games(similar_user, 5)
 recommended_genres = recommend_genres(g[root].interests, 5)
 twitch_api = TwitchAPI("key.conf")
+twitch_api.resolve_game_ids([game_name_mapping[str(item['appid'])] for item in recommended_games])
 
 
 # Command-line interface
@@ -0,0 +1,286 @@
+import numpy as np
+
+from array_graph import ArrayGraph, modified_sigmoid, segment_sum
+from vocabulary import GenreVocabulary
+
+
+class IncrementalGraph:
+    '''
+    Mutable graph that keeps the all-users interest propagation of
+    propagate_interests_all up to date under small changes.
+
+    Friendships and ownerships are kept in per-user insertion-ordered
+    dictionaries, next to the owners of every game and the users that list
+    each user as a friend. Every round of the propagation is kept, since
+    after a change a user's round t only has to be recomputed if its games
+    or friends changed, or if one of its friends changed in round t - 1.
+    Changes only mark users and games dirty; update() then re-aggregates the
+    dirty users and their dependents, round by round.
+
+    Attributes:
+    ----------
+    user_ids : list
+        The Steam id of every user.
+    game_ids : list
+        The app id of every game.
+    vocabulary : GenreVocabulary
+        The genre vocabulary.
+    rounds : list
+        The users x genres interest matrix after every round, the last one
+        being the propagated interests.
+    '''
+    def __init__(self, snapshot, rounds=2, user_weight=0.8):
+        self.num_rounds = rounds
+        self.user_weight = user_weight
+        self.vocabulary = GenreVocabulary(snapshot.genres)
+
+        self.user_ids = [str(user_id) for user_id in snapshot.user_ids.tolist()]
+        self.user_index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self.friends = [dict.fromkeys(snapshot.friends(user).tolist()) for user in range(snapshot.num_users)]
+        self.followers = [{} for _ in self.user_ids]
+        for user, friends in enumerate(self.friends):
+            for friend in friends:
+                self.followers[friend][user] = None
+
+        self.game_ids = snapshot.game_ids.tolist()
+        self.game_index = {game_id: i for i, game_id in enumerate(self.game_ids)}
+        self.game_names = list(snapshot.game_names)
+        self.game_genres = [np.asarray(snapshot.game_genres(game), dtype=np.int64) for game in range(snapshot.num_games)]
+        self.games = []
+        self.owners = [{} for _ in self.game_ids]
+        for user in range(snapshot.num_users):
+            games, playtimes = snapshot.games(user)
+            self.games.append(dict(zip(games.tolist(), playtimes.tolist())))
+            for game in games.tolist():
+                self.owners[game][user] = None
+
+        width = len(self.vocabulary)
+        self._game_vectors = np.zeros((len(self.game_ids), width), dtype=np.float32)
+        self._game_sum = np.zeros((len(self.user_ids), width))
+        self._game_cnt = np.zeros((len(self.user_ids), width))
+        self._rounds = [np.zeros((len(self.user_ids), width)) for _ in range(rounds + 1)]
+        self._dirty_games = set(range(len(self.game_ids)))
+        self._dirty_totals = set(range(len(self.user_ids)))
+        self._dirty_edges = set()
+        self.update()
+
+    @classmethod
+    def from_mappings(cls, user_friend_graph, user_game_mapping, game_detail, **kwargs):
+        return cls(ArrayGraph.from_mappings(user_friend_graph, user_game_mapping, game_detail).snapshot, **kwargs)
+
+    @property
+    def game_vectors(self):
+        return self._game_vectors[:len(self.game_ids), :len(self.vocabulary)]
+
+    @property
+    def game_sum(self):
+        return self._game_sum[:len(self.user_ids), :len(self.vocabulary)]
+
+    @property
+    def game_cnt(self):
+        return self._game_cnt[:len(self.user_ids), :len(self.vocabulary)]
+
+    @property
+    def rounds(self):
+        return [matrix[:len(self.user_ids), :len(self.vocabulary)] for matrix in self._rounds]
+
+    @property
+    def interests(self):
+        return self.rounds[-1]
+
+    def user_interests(self, user_id):
+        '''
+        Return the propagated interests of a user as (genre, score) tuples.
+        '''
+        return self.vocabulary.interests(self.interests[self.user_index[str(user_id)]])
+
+    def owns_games(self):
+        return np.array([bool(games) for games in self.games], dtype=bool)
+
+    def _grow(self):
+        '''
+        Make room in the matrices for the current numbers of users, games and
+        genres. Capacity at least doubles whenever it runs out, so adding
+        users or genres one by one costs amortized constant time each; the
+        properties expose views trimmed to the actual sizes.
+        '''
+        def capacity(size, needed):
+            return size if needed <= size else max(needed, 2 * size)
+
+        user_rows, genre_columns = self._game_sum.shape
+        game_rows = self._game_vectors.shape[0]
+        user_rows = capacity(user_rows, len(self.user_ids))
+        game_rows = capacity(game_rows, len(self.game_ids))
+        genre_columns = capacity(genre_columns, len(self.vocabulary))
+
+        def grow(matrix, rows):
+            if matrix.shape == (rows, genre_columns):
+                return matrix
+            grown = np.zeros((rows, genre_columns), dtype=matrix.dtype)
+            grown[:matrix.shape[0], :matrix.shape[1]] = matrix
+            return grown
+
+        self._game_vectors = grow(self._game_vectors, game_rows)
+        self._game_sum = grow(self._game_sum, user_rows)
+        self._game_cnt = grow(self._game_cnt, user_rows)
+        self._rounds = [grow(matrix, user_rows) for matrix in self._rounds]
+
+    def add_user(self, user_id):
+        '''
+        Add a user without friends or games, returning its index.
+        '''
+        user_id = str(user_id)
+        if user_id not in self.user_index:
+            self.user_index[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+            self.friends.append({})
+            self.followers.append({})
+            self.games.append({})
+            self._grow()
+        return self.user_index[user_id]
+
+    def add_game(self, game_id, genres=(), name=None):
+        '''
+        Add a game with the given genre names, returning its index.
+        '''
+        game_id = int(game_id)
+        if game_id not in self.game_index:
+            self.game_index[game_id] = len(self.game_ids)
+            self.game_ids.append(game_id)
+            self.game_names.append(name)
+            self.game_genres.append(np.array([self.vocabulary.add(genre) for genre in genres], dtype=np.int64))
+            self.owners.append({})
+            self._grow()
+        return self.game_index[game_id]
+
+    def add_friendship(self, user_id, friend_id):
+        '''
+        Make two users friends of each other, adding them if needed.
+        '''
+        user, friend = self.add_user(user_id), self.add_user(friend_id)
+        if user == friend:
+            return
+        for a, b in ((user, friend), (friend, user)):
+            if b not in self.friends[a]:
+                self.friends[a][b] = None
+                self.followers[b][a] = None
+                self._dirty_edges.add(a)
+
+    def remove_friendship(self, user_id, friend_id):
+        user, friend = self.user_index[str(user_id)], self.user_index[str(friend_id)]
+        for a, b in ((user, friend), (friend, user)):
+            if b in self.friends[a]:
+                del self.friends[a][b]
+                del self.followers[b][a]
+                self._dirty_edges.add(a)
+
+    def set_game(self, user_id, game_id, playtime, genres=None):
+        '''
+        Record that a user owns a game with the given playtime, either a new
+        ownership or a playtime change. genres is only used for games that
+        are not in the graph yet.
+        '''
+        user = self.add_user(user_id)
+        game = self.add_game(game_id, genres or ())
+        if self.games[user].get(game) != playtime:
+            self.games[user][game] = playtime
+            self.owners[game][user] = None
+            self._dirty_games.add(game)
+            self._dirty_totals.add(user)
+
+    def remove_game(self, user_id, game_id):
+        user, game = self.user_index[str(user_id)], self.game_index[int(game_id)]
+        if game in self.games[user]:
+            del self.games[user][game]
+            del self.owners[game][user]
+            self._dirty_games.add(game)
+            self._dirty_totals.add(user)
+
+    def apply(self, deltas):
+        '''
+        Apply a list of changes and update the interests.
+
+        Parameters:
+        -----------
+        deltas : list
+            Tuples of a change name and its arguments, e.g.
+            ("add_friendship", user_id, friend_id), ("remove_friendship", user_id, friend_id),
+            ("set_game", user_id, game_id, playtime) or ("remove_game", user_id, game_id).
+
+        Returns:
+        --------
+        np.ndarray
+            The indices of the users whose interests were recomputed.
+        '''
+        operations = {
+            'add_friendship': self.add_friendship,
+            'remove_friendship': self.remove_friendship,
+            'set_game': self.set_game,
+            'remove_game': self.remove_game,
+        }
+        for name, *args in deltas:
+            operations[name](*args)
+        return self.update()
+
+    def update(self):
+        '''
+        Re-aggregate the users affected by the changes made since the last update.
+
+        Returns:
+        --------
+        np.ndarray
+            The indices of the users whose interests were recomputed.
+        '''
+        for game in self._dirty_games:
+            owners = list(self.owners[game])
+            mean = modified_sigmoid([self.games[owner][game] for owner in owners]).mean() if owners else 0.0
+            self.game_vectors[game] = 0
+            self.game_vectors[game, self.game_genres[game]] = mean
+            self._dirty_totals.update(owners)
+
+        totals = np.array(sorted(self._dirty_totals), dtype=np.int64)
+        if len(totals):
+            games = [list(self.games[user]) for user in totals]
+            indptr = np.cumsum([0] + [len(user_games) for user_games in games])
+            vectors = self.game_vectors[np.array([game for user_games in games for game in user_games], dtype=np.int64)]
+            self.game_sum[totals] = segment_sum(vectors, indptr)
+            self.game_cnt[totals] = segment_sum(vectors > 0, indptr)
+            self.rounds[0][totals] = np.divide(self.game_sum[totals], self.game_cnt[totals],
+                                               out=np.zeros((len(totals), self.game_sum.shape[1])),
+                                               where=self.game_cnt[totals] > 0)
+
+        changed = set(self._dirty_totals)
+        base = self._dirty_totals | self._dirty_edges
+        recomputed = set(changed)
+        for t in range(1, self.num_rounds + 1):
+            changed = base | {follower for user in changed for follower in self.followers[user]}
+            users = np.array(sorted(changed), dtype=np.int64)
+            recomputed |= changed
+            if not len(users):
+                break
+            friends = [list(self.friends[user]) for user in users]
+            indptr = np.cumsum([0] + [len(user_friends) for user_friends in friends])
+            previous = self.rounds[t - 1][np.array([f for user_friends in friends for f in user_friends], dtype=np.int64)]
+            total = self.game_sum[users] + self.user_weight * segment_sum(previous, indptr)
+            count = self.game_cnt[users] + segment_sum(previous > 0, indptr)
+            self.rounds[t][users] = np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+
+        self._dirty_games = set()
+        self._dirty_totals = set()
+        self._dirty_edges = set()
+        return np.array(sorted(recomputed), dtype=np.int64)
+
+    def to_mappings(self):
+        '''
+        Return the graph as user_friend_graph, user_game_mapping and game_detail dictionaries.
+        '''
+        user_friend_graph = {user_id: [self.user_ids[friend] for friend in self.friends[user]]
+                             for user, user_id in enumerate(self.user_ids)}
+        user_game_mapping = {user_id: [{"appid": self.game_ids[game], "playtime_forever": playtime}
+                                       for game, playtime in self.games[user].items()]
+                             for user, user_id in enumerate(self.user_ids)}
+        game_detail = {str(game_id): {"name": self.game_names[game],
+                                      "genres": [{"description": self.vocabulary.genres[genre]}
+                                                 for genre in self.game_genres[game]]}
+                       for game, game_id in enumerate(self.game_ids)}
+        return user_friend_graph, user_game_mapping, game_detail
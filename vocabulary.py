@@ -0,0 +1,50 @@
+import numpy as np
+
+
+class GenreVocabulary:
+    '''
+    Interned genre names: every genre gets a fixed integer id, so interests
+    can be stored as fixed-length vectors instead of lists of (genre, score)
+    tuples.
+
+    Attributes:
+    ----------
+    genres : list
+        The genre name of every id.
+    index : dict
+        A dictionary mapping genre names to their ids.
+    '''
+    def __init__(self, genres=()):
+        self.genres = []
+        self.index = {}
+        for genre in genres:
+            self.add(genre)
+
+    @classmethod
+    def from_game_interests(cls, game_interests):
+        '''
+        Build the vocabulary of a game id to genre list mapping such as game_interests_mapping.
+        '''
+        vocabulary = cls()
+        for genres in game_interests.values():
+            for genre in genres:
+                vocabulary.add(genre)
+        return vocabulary
+
+    def add(self, genre):
+        if genre not in self.index:
+            self.index[genre] = len(self.genres)
+            self.genres.append(genre)
+        return self.index[genre]
+
+    def __len__(self):
+        return len(self.genres)
+
+    def indices(self, genres):
+        return np.array([self.index[genre] for genre in genres], dtype=np.int64)
+
+    def interests(self, vector):
+        '''
+        Convert an interest vector to the list of (genre, score) tuples of its non-zero entries.
+        '''
+        return [(self.genres[i], float(vector[i])) for i in np.flatnonzero(vector)]